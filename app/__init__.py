@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_caching import Cache
 from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 import os
 from datetime import timedelta
@@ -22,8 +23,16 @@ def create_app():
     # Setup Caching (Redis)
     cache = Cache(app, config={"CACHE_TYPE": "redis", "CACHE_REDIS_URL": "redis://localhost:6379/0"})
 
-    # Setup Rate Limiting
-    limiter = Limiter(app, default_limits=["100 per hour", "10 per minute"])
+    # Setup Rate Limiting (shared storage, see app.limiter_storage)
+    from app.limiter_storage import LIMITER_STORAGE_URI, LIMITER_STRATEGY
+    limiter = Limiter(
+        get_remote_address,
+        app=app,
+        default_limits=["100 per hour", "10 per minute"],
+        storage_uri=LIMITER_STORAGE_URI,
+        strategy=LIMITER_STRATEGY,
+        in_memory_fallback_enabled=True
+    )
 
     # Register blueprints
     from app.auth import auth_bp
@@ -31,27 +40,24 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(routes_bp, url_prefix="/api")
 
+    # Leaderboards and distributions over NumPy arrays of driver stats
+    from app.analytics import analytics_bp
+    app.register_blueprint(analytics_bp, url_prefix="/api/analytics")
+
     # More blueprints can be registered here
-    
-    @app.before_request
-    def make_session_permanent():
-        from flask import session, request, redirect
-        import time
-        
-        session.permanent = True
-        
-        if 'last_activity' in session and 'user' in session:
-            last_active = session['last_activity']
-            current_time = time.time()
-            
-            # If inactive for too long, clear session (2 hours)
-            if current_time - last_active > 7200:  # 2 hours in seconds
-                session.clear()
-                
-                # Only redirect if not already heading to auth page
-                if not request.path.startswith('/auth') and not request.path.startswith('/api/auth'):
-                    return redirect('/auth')
-        
-        session['last_activity'] = time.time()
-    
+
+    # Request metrics in Prometheus format at /metrics
+    from app.metrics import init_metrics
+    init_metrics(app, limiter=limiter)
+
+    # msgspec-backed JSON, with gzip/brotli for large responses
+    from app.json_provider import init_json
+    from app.http_cache import init_compression
+    init_json(app)
+    init_compression(app)
+
+    # Server-side sessions; signed-in sessions idle for 2 hours are cleared
+    from app.sessions import init_sessions
+    init_sessions(app)
+
     return app
@@ -0,0 +1,423 @@
+import threading
+
+import numpy as np
+from firebase_admin import firestore
+from flask import Blueprint, request, jsonify, current_app
+
+from app.auth import login_required
+from app.cache import LRUCache
+from app.http_cache import conditional
+from app.profiler import profiler, query_shape
+from app.replica import driver_replica
+from app.singleflight import coalesce
+from app.teams import team_resolver
+from app.versions import collection_versions
+
+db = firestore.client()
+
+analytics_bp = Blueprint("analytics_bp", __name__)
+
+# Per-driver stats loaded into the arrays; a higher value ranks first for each
+ANALYTICS_STATS = ['race_wins', 'pole_positions', 'fastest_laps', 'world_titles', 'age']
+
+# Ratio name -> (numerator, denominator). There is no races-entered field,
+# so "win rate" is measured against pole positions
+RATIOS = {
+    'wins_per_pole': ('race_wins', 'pole_positions'),
+    'fastest_laps_per_win': ('fastest_laps', 'race_wins'),
+    'titles_per_win': ('world_titles', 'race_wins'),
+}
+
+# Ratios over smaller denominators are left out of ratio leaderboards (1 win from 1 pole isn't 100%)
+RATIO_MIN_DENOMINATOR = 5
+
+SUMMARY_PERCENTILES = [0, 10, 25, 50, 75, 90, 100]
+
+MAX_LEADERBOARD = 100
+MAX_HISTOGRAM_BINS = 50
+
+LOAD_FIELDS = ['name', 'team_id'] + ANALYTICS_STATS
+
+
+def _number(value):
+    # Missing or non-numeric stats are NaN, so they're left out rather than counted as 0
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def plain_number(value):
+    """A numpy scalar as a JSON-friendly int/float (None for NaN)"""
+    value = float(value)
+    if np.isnan(value):
+        return None
+    return int(value) if value.is_integer() else round(value, 3)
+
+
+def rank_within(ordered, values):
+    """
+    Competition ranks (ties share a rank, 1 = highest) and percentiles (the
+    share of ordered below each value, ties counted as half) of values
+    within the ascending array ordered
+
+    Returns:
+        tuple: (ranks, percentiles) arrays, one entry per value
+    """
+    below = np.searchsorted(ordered, values, side='left')
+    at_or_below = np.searchsorted(ordered, values, side='right')
+    count = len(ordered)
+    return count - at_or_below + 1, (below + 0.5 * (at_or_below - below)) / count * 100
+
+
+class DriverArrays:
+    """
+    Driver stats as NumPy columns
+
+    matrix holds one float column per ANALYTICS_STATS entry (NaN where a
+    driver has no numeric value), ratios one column per RATIOS entry (NaN
+    where either side is missing or the denominator is 0) and team_index
+    each driver's position in team_ids. Each stat column is also kept
+    sorted, with its counts[i] numeric values first and the NaNs last, so
+    ranks and percentiles are binary searches over ordered(stat).
+    """
+
+    def __init__(self, drivers):
+        self.ids = np.array([driver['id'] for driver in drivers], dtype=object)
+        self.names = np.array([str(driver.get('name', '')) for driver in drivers], dtype=object)
+        self.team_ids, self.team_index = np.unique(
+            np.array([str(driver.get('team_id') or '') for driver in drivers], dtype=object).astype(str),
+            return_inverse=True
+        )
+        # Back to Python strings, so they go straight into JSON
+        self.team_ids = self.team_ids.astype(object)
+        self.team_index = self.team_index.reshape(-1)
+        self.matrix = np.array([[_number(driver.get(stat)) for stat in ANALYTICS_STATS] for driver in drivers],
+                               dtype=np.float64).reshape(len(drivers), len(ANALYTICS_STATS))
+        self.sorted = np.sort(self.matrix, axis=0)
+        self.counts = (~np.isnan(self.matrix)).sum(axis=0)
+
+        numerators = self.matrix[:, [ANALYTICS_STATS.index(num) for num, _ in RATIOS.values()]]
+        denominators = self.matrix[:, [ANALYTICS_STATS.index(den) for _, den in RATIOS.values()]]
+        self.ratios = np.divide(numerators, denominators, out=np.full_like(numerators, np.nan),
+                                where=denominators > 0)
+        self.ratio_denominators = denominators
+
+        # Alphabetical position of every name, the tie-breaker for leaderboards
+        self.name_rank = np.argsort(np.argsort(self.names.astype(str), kind='stable'), kind='stable')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, stat):
+        return self.matrix[:, ANALYTICS_STATS.index(stat)]
+
+    def ordered(self, stat):
+        """The stat's numeric values, ascending"""
+        i = ANALYTICS_STATS.index(stat)
+        return self.sorted[:self.counts[i], i]
+
+
+@coalesce('analytics.load_drivers')
+@profiler.profile('analytics.load_drivers', shape=query_shape('drivers', fields=LOAD_FIELDS))
+def _load_drivers(version):
+    # version only keys the single-flight group, so one load runs per change
+    if driver_replica.available():
+        profiler.annotate(shape='replica/drivers', reads=0)
+        return driver_replica.all(LOAD_FIELDS)
+    query = db.collection('drivers').select(LOAD_FIELDS)
+    return [{"id": doc.id, **doc.to_dict()} for doc in query.stream()]
+
+
+class DriverAnalytics:
+    """
+    Leaderboards, distributions and per-team aggregates of driver stats
+
+    Driver stats are loaded into NumPy arrays once per data version (the
+    drivers/teams write counters) and every report is computed with
+    vectorized operations over whole columns. Reports are cached under the
+    version too, so between writes a report is computed once, and a write
+    costs one projected scan (or none, with the drivers replica on).
+
+    Args:
+        cache_entries (int): Computed reports kept per process
+    """
+
+    def __init__(self, cache_entries=256):
+        self._lock = threading.Lock()
+        self._version = None
+        self._arrays = None
+        self._results = LRUCache(max_entries=cache_entries, default_timeout=3600)
+
+    def arrays(self):
+        """The arrays for the current data version, loading them if it moved"""
+        version = collection_versions.get('drivers', 'teams')
+        with self._lock:
+            if version == self._version:
+                return version, self._arrays
+        arrays = DriverArrays(_load_drivers(version))
+        with self._lock:
+            self._version, self._arrays = version, arrays
+        return version, arrays
+
+    def _cached(self, report, params, compute):
+        version, arrays = self.arrays()
+        key = (version, report, params)
+        result = self._results.get(key)
+        if result is None:
+            result = compute(arrays)
+            self._results.set(key, result)
+        return result
+
+    def summary(self):
+        """Count, total, mean, spread and percentiles of every stat and ratio"""
+        return self._cached('summary', (), self._summary)
+
+    def leaderboard(self, stat, limit=10, team_id=None):
+        """
+        Top drivers on a stat or ratio
+
+        Entries carry competition ranks (ties share a rank) and the
+        percentile among all drivers, ties counted as half like comparisons.
+
+        Raises:
+            ValueError: If stat isn't a known stat or ratio
+        """
+        if stat not in ANALYTICS_STATS and stat not in RATIOS:
+            raise ValueError(f"stat must be one of {', '.join(ANALYTICS_STATS + list(RATIOS))}")
+        limit = min(max(int(limit), 1), MAX_LEADERBOARD)
+        return self._cached('leaderboard', (stat, limit, team_id or None),
+                            lambda arrays: self._leaderboard(arrays, stat, limit, team_id))
+
+    def teams(self):
+        """Per-team driver counts, totals, means and bests, plus each team's share of all wins"""
+        return self._cached('teams', (), self._teams)
+
+    def histogram(self, stat, bins=10):
+        """
+        Distribution of a stat in integer-aligned buckets
+
+        Raises:
+            ValueError: If stat isn't a known stat
+        """
+        if stat not in ANALYTICS_STATS:
+            raise ValueError(f"stat must be one of {', '.join(ANALYTICS_STATS)}")
+        bins = min(max(int(bins), 1), MAX_HISTOGRAM_BINS)
+        return self._cached('histogram', (stat, bins), lambda arrays: self._histogram(arrays, stat, bins))
+
+    # Computations
+
+    @staticmethod
+    def _summary(arrays):
+        count = len(arrays)
+        result = {"drivers": count, "stats": {}, "ratios": {}}
+        if not count:
+            return result
+
+        # Every stat in one pass over the matrix, skipping missing values;
+        # stats no driver has a value for are left as NaN (null)
+        present = arrays.counts > 0
+        percentiles = np.full((len(SUMMARY_PERCENTILES), len(ANALYTICS_STATS)), np.nan)
+        means = np.full(len(ANALYTICS_STATS), np.nan)
+        stds = np.full(len(ANALYTICS_STATS), np.nan)
+        percentiles[:, present] = np.nanpercentile(arrays.matrix[:, present], SUMMARY_PERCENTILES, axis=0)
+        means[present] = np.nanmean(arrays.matrix[:, present], axis=0)
+        stds[present] = np.nanstd(arrays.matrix[:, present], axis=0)
+        totals = np.nansum(arrays.matrix, axis=0)
+        for i, stat in enumerate(ANALYTICS_STATS):
+            result["stats"][stat] = {
+                "drivers": int(arrays.counts[i]),
+                "total": plain_number(totals[i]),
+                "mean": plain_number(round(means[i], 2)),
+                "std": plain_number(round(stds[i], 2)),
+                "min": plain_number(percentiles[0, i]),
+                "max": plain_number(percentiles[-1, i]),
+                "percentiles": {str(q): plain_number(percentiles[j, i]) for j, q in enumerate(SUMMARY_PERCENTILES[1:-1], 1)},
+            }
+
+        valid = ~np.isnan(arrays.ratios)
+        for i, name in enumerate(RATIOS):
+            column = arrays.ratios[valid[:, i], i]
+            numerator, denominator = RATIOS[name]
+            overall = totals[ANALYTICS_STATS.index(denominator)]
+            result["ratios"][name] = {
+                "drivers": int(len(column)),
+                "overall": plain_number(totals[ANALYTICS_STATS.index(numerator)] / overall) if overall else None,
+                "median": plain_number(np.median(column)) if len(column) else None,
+                "max": plain_number(column.max()) if len(column) else None,
+            }
+        return result
+
+    @staticmethod
+    def _leaderboard(arrays, stat, limit, team_id):
+        if stat in RATIOS:
+            i = list(RATIOS).index(stat)
+            values = arrays.ratios[:, i]
+            eligible = (arrays.ratio_denominators[:, i] >= RATIO_MIN_DENOMINATOR) & ~np.isnan(values)
+            ordered = np.sort(values[eligible])
+        else:
+            values = arrays.column(stat)
+            eligible = ~np.isnan(values)
+            ordered = arrays.ordered(stat)
+
+        selected = eligible.copy()
+        if team_id:
+            match = np.flatnonzero(arrays.team_ids == team_id)
+            selected &= arrays.team_index == match[0] if len(match) else False
+
+        candidates = np.flatnonzero(selected)
+        if not len(candidates):
+            return {"stat": stat, "team_id": team_id, "drivers": 0, "leaders": []}
+
+        # Highest value first, then name; only the top `limit` are fully sorted
+        top = candidates
+        if len(candidates) > limit:
+            top = candidates[np.argpartition(-values[candidates], limit - 1)[:limit]]
+            # Drivers tied with the last one kept may sort ahead of it by name
+            cutoff = values[top].min()
+            top = candidates[values[candidates] >= cutoff]
+        top = top[np.lexsort((arrays.name_rank[top], -values[top]))][:limit]
+
+        # Rank within this leaderboard; percentile among every eligible driver
+        ranks, _ = rank_within(np.sort(values[candidates]), values[top])
+        _, percentiles = rank_within(ordered, values[top])
+
+        team_names = team_resolver.resolve(arrays.team_ids[arrays.team_index[top]].tolist())
+        return {
+            "stat": stat,
+            "team_id": team_id,
+            "drivers": int(len(candidates)),
+            "leaders": [{
+                "rank": int(ranks[j]),
+                "id": arrays.ids[row],
+                "name": arrays.names[row],
+                "team_id": arrays.team_ids[arrays.team_index[row]] or None,
+                "team_name": team_names.get(arrays.team_ids[arrays.team_index[row]]),
+                "value": plain_number(values[row]),
+                "percentile": round(float(percentiles[j]), 1),
+            } for j, row in enumerate(top)],
+        }
+
+    @staticmethod
+    def _teams(arrays):
+        team_count = len(arrays.team_ids)
+        if not len(arrays):
+            return {"teams": []}
+
+        # Sums, counts and maxima for every team and stat at once; missing
+        # values add nothing and don't count towards a team's means
+        counts = np.bincount(arrays.team_index, minlength=team_count)
+        present = ~np.isnan(arrays.matrix)
+        sums = np.zeros((team_count, len(ANALYTICS_STATS)))
+        np.add.at(sums, arrays.team_index, np.where(present, arrays.matrix, 0))
+        valued = np.zeros((team_count, len(ANALYTICS_STATS)))
+        np.add.at(valued, arrays.team_index, present)
+        bests = np.full((team_count, len(ANALYTICS_STATS)), np.nan)
+        np.fmax.at(bests, arrays.team_index, arrays.matrix)
+        means = np.divide(sums, valued, out=np.full_like(sums, np.nan), where=valued > 0)
+
+        total_wins = np.nansum(arrays.column('race_wins'))
+        wins = sums[:, ANALYTICS_STATS.index('race_wins')]
+        poles = sums[:, ANALYTICS_STATS.index('pole_positions')]
+        win_share = wins / total_wins if total_wins else np.zeros(team_count)
+
+        names = team_resolver.resolve([team_id for team_id in arrays.team_ids.tolist() if team_id])
+        teams = []
+        for t in np.argsort(-wins, kind='stable'):
+            team_id = arrays.team_ids[t]
+            teams.append({
+                "team_id": team_id or None,
+                "team_name": names.get(team_id) if team_id else None,
+                "drivers": int(counts[t]),
+                "totals": {stat: plain_number(sums[t, i]) for i, stat in enumerate(ANALYTICS_STATS)},
+                "means": {stat: plain_number(round(means[t, i], 2)) for i, stat in enumerate(ANALYTICS_STATS)},
+                "bests": {stat: plain_number(bests[t, i]) for i, stat in enumerate(ANALYTICS_STATS)},
+                "win_share": round(float(win_share[t]), 4),
+                "wins_per_pole": plain_number(wins[t] / poles[t]) if poles[t] else None,
+            })
+        return {"teams": teams}
+
+    @staticmethod
+    def _histogram(arrays, stat, bins):
+        values = arrays.ordered(stat)
+        if not len(values):
+            return {"stat": stat, "drivers": 0, "buckets": []}
+
+        # Integer-wide buckets starting at the minimum, so counts never straddle a value
+        low, high = np.floor(values.min()), np.floor(values.max())
+        width = max(1.0, np.ceil((high - low + 1) / bins))
+        edges = low + width * np.arange(int(np.ceil((high - low + 1) / width)) + 1)
+        counts, edges = np.histogram(values, bins=edges)
+        return {
+            "stat": stat,
+            "drivers": int(len(values)),
+            "buckets": [{"from": plain_number(edges[i]), "to": plain_number(edges[i + 1] - 1), "count": int(count)}
+                        for i, count in enumerate(counts)],
+        }
+
+    def invalidate(self):
+        """Drop the arrays and every cached report"""
+        with self._lock:
+            self._version = None
+            self._arrays = None
+        self._results.clear()
+
+    def stats(self):
+        return {"version": self._version, "drivers": len(self._arrays) if self._arrays is not None else 0,
+                "reports": self._results.stats()}
+
+
+# Shared engine for the process
+driver_analytics = DriverAnalytics()
+
+
+@analytics_bp.route("/summary", methods=["GET"])
+@login_required
+@conditional("drivers", "teams")
+def analytics_summary():
+    try:
+        return jsonify(driver_analytics.summary()), 200
+    except Exception as e:
+        current_app.logger.error(f"Error computing analytics summary: {str(e)}")
+        return jsonify({"error": f"Failed to compute analytics: {str(e)}"}), 500
+
+
+@analytics_bp.route("/leaderboard", methods=["GET"])
+@login_required
+@conditional("drivers", "teams")
+def analytics_leaderboard():
+    try:
+        return jsonify(driver_analytics.leaderboard(
+            request.args.get("stat", "race_wins"),
+            limit=request.args.get("limit", 10),
+            team_id=request.args.get("team_id")
+        )), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error computing leaderboard: {str(e)}")
+        return jsonify({"error": f"Failed to compute analytics: {str(e)}"}), 500
+
+
+@analytics_bp.route("/teams", methods=["GET"])
+@login_required
+@conditional("drivers", "teams")
+def analytics_teams():
+    try:
+        return jsonify(driver_analytics.teams()), 200
+    except Exception as e:
+        current_app.logger.error(f"Error computing team analytics: {str(e)}")
+        return jsonify({"error": f"Failed to compute analytics: {str(e)}"}), 500
+
+
+@analytics_bp.route("/histogram", methods=["GET"])
+@login_required
+@conditional("drivers", "teams")
+def analytics_histogram():
+    try:
+        return jsonify(driver_analytics.histogram(
+            request.args.get("stat", "race_wins"),
+            bins=request.args.get("bins", 10)
+        )), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error computing histogram: {str(e)}")
+        return jsonify({"error": f"Failed to compute analytics: {str(e)}"}), 500
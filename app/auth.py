@@ -4,6 +4,8 @@ import os
 from flask import Blueprint, request, jsonify, session, redirect, current_app
 from firebase_admin import auth as firebase_auth
 from functools import wraps
+from app.http_client import identity_toolkit
+from app.sessions import regenerate_session, end_session
 
 auth_bp = Blueprint("auth_bp", __name__)
 
@@ -31,9 +33,9 @@ def login():
         password = request.json.get("password")
 
         firebase_api_key = os.getenv("FIREBASE_API_KEY")
-        firebase_auth_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={firebase_api_key}"
-        
-        response = requests.post(firebase_auth_url, json={
+
+        # Pooled keep-alive session, so logins reuse the TLS connection
+        response = identity_toolkit.post("accounts:signInWithPassword", params={"key": firebase_api_key}, json={
             "email": email, 
             "password": password, 
             "returnSecureToken": True
@@ -44,8 +46,12 @@ def login():
             return jsonify({"error": data.get("error", {}).get("message", "Invalid credentials")}), 400
 
         session["user"] = {"email": email, "uid": data["localId"]}
+        regenerate_session()
         return jsonify({"message": "Login successful", "user": session["user"]}), 200
 
+    except requests.RequestException as e:
+        current_app.logger.error(f"Login error: identity toolkit unreachable: {str(e)}")
+        return jsonify({"error": "Authentication service unavailable"}), 503
     except Exception as e:
         current_app.logger.error(f"Login error: {str(e)}")
         return jsonify({"error": str(e)}), 400
@@ -81,6 +87,7 @@ def google_login():
         # Add session security info
         session["created_at"] = time.time()
         session["user_agent"] = request.headers.get("User-Agent")
+        regenerate_session()
 
         return jsonify({
             "message": "Google login successful", 
@@ -97,7 +104,7 @@ def google_login():
 @auth_bp.route("/logout")
 def logout():
     try:
-        session.clear()
+        end_session()
         return jsonify({"message": "Logout successful"}), 200
     except Exception as e:
         current_app.logger.error(f"Logout error: {str(e)}")
@@ -116,9 +123,7 @@ def refresh_token():
         custom_token = firebase_auth.create_custom_token(uid)
         
         # Exchange custom token for ID token via Firebase REST API
-        auth_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithCustomToken?key={FIREBASE_API_KEY}"
-        
-        response = requests.post(auth_url, json={
+        response = identity_toolkit.post("accounts:signInWithCustomToken", params={"key": FIREBASE_API_KEY}, json={
             "token": custom_token.decode('utf-8'),
             "returnSecureToken": True
         })
@@ -133,6 +138,9 @@ def refresh_token():
         
         return jsonify({"message": "Token refreshed successfully"}), 200
         
+    except requests.RequestException as e:
+        current_app.logger.error(f"Token refresh error: identity toolkit unreachable: {str(e)}")
+        return jsonify({"error": "Authentication service unavailable"}), 503
     except Exception as e:
         current_app.logger.error(f"Token refresh error: {str(e)}")
         return jsonify({"error": str(e)}), 400
@@ -0,0 +1,186 @@
+import csv
+import json
+import logging
+import sys
+from contextlib import contextmanager
+
+from firebase_admin import firestore
+
+from app.db_utils import batch_get, batch_write
+from app.teams import team_resolver
+from app.versions import bump_version
+from app.validation import validate_driver, validate_team
+
+db = firestore.client()
+logger = logging.getLogger(__name__)
+
+# Columns written for CSV exports; NDJSON exports keep every field
+EXPORT_COLUMNS = {
+    "drivers": ["id", "name", "age", "team", "team_id", "nationality", "race_wins",
+                "pole_positions", "fastest_laps", "world_titles", "active", "created_by"],
+    "teams": ["id", "name", "year_founded", "race_wins", "pole_positions",
+              "constructor_titles", "finishing_position", "created_by"],
+}
+
+# Rows are validated and written this many at a time, so memory stays flat
+IMPORT_CHUNK_SIZE = 2000
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    raise ValueError(f"Can't tell the format of {path}; pass --format csv or ndjson")
+
+
+@contextmanager
+def _open(path, mode):
+    if path == "-":
+        yield sys.stdin if "r" in mode else sys.stdout
+    else:
+        with open(path, mode, newline="", encoding="utf-8") as f:
+            yield f
+
+
+def read_rows(path, fmt=None):
+    """Yield (line number, row dict) from an NDJSON or CSV file one row at a time"""
+    fmt = detect_format(path, fmt)
+    with _open(path, "r") as f:
+        if fmt == "csv":
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, {"__error__": f"Invalid JSON: {e.msg}"}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_collection(collection, path, fmt=None, user_id="bulk-import", max_workers=4,
+                      dry_run=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Stream drivers or teams from a file into Firestore
+
+    Rows are validated with the same rules as the web forms; a driver's
+    team_id must name an existing team (resolved in bulk per chunk). Rows
+    with an "id" column are merged into that document if it exists (keeping
+    its created_by and created_at, so an import never takes over ownership),
+    so re-running an import is idempotent. Invalid rows are reported and
+    skipped.
+
+    Returns:
+        dict: Counts of rows read, valid, written, rejected and failed, plus the errors
+    """
+    validate = validate_driver if collection == "drivers" else validate_team
+    summary = {"read": 0, "valid": 0, "written": 0, "rejected": 0, "failed": 0, "errors": []}
+
+    for chunk in _chunks(read_rows(path, fmt), chunk_size):
+        records = []
+        for line_number, row in chunk:
+            summary["read"] += 1
+            try:
+                if "__error__" in row:
+                    raise ValueError(row["__error__"])
+                records.append((line_number, row.get("id") or None, validate(row)))
+            except ValueError as e:
+                summary["rejected"] += 1
+                summary["errors"].append({"line": line_number, "error": str(e)})
+
+        team_names = {}
+        if collection == "drivers":
+            team_names = team_resolver.resolve(data.get("team_id") for _, _, data in records)
+
+        # Rows naming a document are only creations if it doesn't exist yet
+        ids = {doc_id for _, doc_id, _ in records if doc_id}
+        existing = batch_get([db.collection(collection).document(doc_id) for doc_id in ids]) if ids else {}
+
+        operations = []
+        for line_number, doc_id, data in records:
+            if data.get("team_id"):
+                team_name = team_names.get(data["team_id"])
+                if team_name is None:
+                    summary["rejected"] += 1
+                    summary["errors"].append({"line": line_number, "error": f"Team with ID {data['team_id']} not found"})
+                    continue
+                data["team"] = team_name
+
+            data["updated_at"] = firestore.SERVER_TIMESTAMP
+            if existing.get(doc_id) is not None:
+                operations.append(("merge", db.collection(collection).document(doc_id), data))
+                continue
+            data["created_by"] = user_id
+            data["created_at"] = firestore.SERVER_TIMESTAMP
+            operations.append(("set", db.collection(collection).document(doc_id), data))
+
+        summary["valid"] += len(operations)
+        if dry_run or not operations:
+            continue
+
+        for result in batch_write(operations, max_workers=max_workers):
+            count = result["end"] - result["start"]
+            if result["ok"]:
+                summary["written"] += count
+            else:
+                summary["failed"] += count
+                summary["errors"].append({"batch": result["batch"], "error": result["error"]})
+
+    # Conditional GETs of this collection must stop answering 304
+    if summary["written"]:
+        batch = db.batch()
+        bump_version(batch, collection)
+        batch.commit()
+
+    logger.info(f"import {collection} read={summary['read']} written={summary['written']} "
+                f"rejected={summary['rejected']} failed={summary['failed']}")
+    return summary
+
+
+def export_collection(collection, path, fmt=None, page_size=1000):
+    """
+    Stream a collection to an NDJSON or CSV file page by page
+
+    Returns:
+        int: Number of documents written
+    """
+    fmt = detect_format(path, fmt)
+    query = db.collection(collection).order_by("__name__").limit(page_size)
+    count = 0
+
+    with _open(path, "w") as f:
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS[collection], extrasaction="ignore")
+            writer.writeheader()
+
+        page = list(query.stream())
+        while page:
+            for doc in page:
+                row = {"id": doc.id, **doc.to_dict()}
+                if writer:
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(row, default=str) + "\n")
+                count += 1
+            if len(page) < page_size:
+                break
+            page = list(query.start_after(page[-1]).stream())
+
+    logger.info(f"export {collection} documents={count}")
+    return count
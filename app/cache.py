@@ -0,0 +1,281 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# Sentinel so cached None/empty results are distinguishable from a miss
+_MISSING = object()
+
+
+def _estimate_size(value, _depth=0):
+    """Rough size in bytes of a cached value (containers are walked a few levels deep)"""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _estimate_size(k, _depth + 1) + _estimate_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += _estimate_size(item, _depth + 1)
+    return size
+
+
+def make_key(key_prefix, args=(), kwargs=None):
+    """Build a cache key from a prefix and the call arguments"""
+    if not args and not kwargs:
+        return key_prefix
+    parts = [repr(arg) for arg in args]
+    parts.extend(f"{k}={v!r}" for k, v in sorted((kwargs or {}).items()))
+    return f"{key_prefix}:{','.join(parts)}"
+
+
+class _Stripe:
+    """One independently locked LRU segment of the cache"""
+
+    def __init__(self, max_entries, sweep_interval, unlink, account):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, expires_at, size, tags)
+        self.unlink = unlink  # Drops a removed key from the cache's tag index
+        self.account = account  # Adjusts the cache-wide byte total
+        self.max_entries = max_entries
+        self.bytes = 0
+        self.sweep_interval = sweep_interval
+        self.next_sweep = time.time() + sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def remove(self, key):
+        _, _, size, tags = self.entries.pop(key)
+        self.bytes -= size
+        self.account(-size)
+        if tags:
+            self.unlink(key, tags)
+
+    def sweep(self, now):
+        expired = [key for key, (_, expires_at, _, _) in self.entries.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            self.remove(key)
+        self.expirations += len(expired)
+        self.next_sweep = now + self.sweep_interval
+
+    def pop_oldest(self):
+        key, (_, _, size, tags) = self.entries.popitem(last=False)
+        self.bytes -= size
+        self.account(-size)
+        if tags:
+            self.unlink(key, tags)
+        self.evictions += 1
+
+    def evict(self, over_budget):
+        # The newest entry stays; other segments make room if this one can't
+        while len(self.entries) > self.max_entries or (len(self.entries) > 1 and over_budget()):
+            self.pop_oldest()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-process cache with LRU eviction and per-entry TTL
+
+    Entries are spread over lock-striped segments so concurrent gthread
+    workers rarely contend. Each segment is bounded by entry count; the
+    estimated size of all cached values shares one budget, so a single large
+    value (a full driver list) can use most of it. Segments over budget
+    evict their least recently used entries first, then the others do in
+    turn. Expired entries are dropped lazily on access and by a periodic
+    sweep piggybacked on writes.
+
+    Entries can carry tags (e.g. "drivers:*", "uid:<uid>") so a write can
+    evict only the entries it affects via invalidate_tags().
+
+    Args:
+        max_entries (int): Maximum number of entries across all segments
+        max_bytes (int): Approximate upper bound on cached value size; larger values aren't cached
+        default_timeout (int): TTL in seconds used when set() gets none (0 = no expiry)
+        stripes (int): Number of independently locked segments
+        sweep_interval (int): Seconds between expiry sweeps of a segment
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, default_timeout=300,
+                 stripes=16, sweep_interval=60):
+        stripes = max(1, min(stripes, max_entries))
+        self.default_timeout = default_timeout
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._bytes_lock = threading.Lock()
+        self._next_victim = 0
+        self._tags = {}  # tag -> set of keys
+        self._tag_lock = threading.Lock()
+        self._stripes = [
+            _Stripe(max(1, max_entries // stripes), sweep_interval, self._unlink, self._account)
+            for _ in range(stripes)
+        ]
+
+    def _account(self, delta):
+        with self._bytes_lock:
+            self._bytes += delta
+
+    def _over_budget(self):
+        return self._bytes > self.max_bytes
+
+    def _enforce_budget(self, writer):
+        # Called without any segment lock held; segments are locked one at a
+        # time. The writer's segment is already down to its newest entry.
+        start = self._next_victim
+        for i in range(len(self._stripes)):
+            if not self._over_budget():
+                return
+            stripe = self._stripes[(start + i) % len(self._stripes)]
+            if stripe is writer:
+                continue
+            with stripe.lock:
+                while stripe.entries and self._over_budget():
+                    stripe.pop_oldest()
+        self._next_victim = (start + 1) % len(self._stripes)
+
+    def _link(self, key, tags):
+        with self._tag_lock:
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def _unlink(self, key, tags):
+        with self._tag_lock:
+            for tag in tags:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get(self, key, default=None):
+        stripe = self._stripe(key)
+        now = time.time()
+        with stripe.lock:
+            entry = stripe.entries.get(key)
+            if entry is None:
+                stripe.misses += 1
+                return default
+
+            value, expires_at, _, _ = entry
+            if expires_at is not None and expires_at <= now:
+                stripe.remove(key)
+                stripe.expirations += 1
+                stripe.misses += 1
+                return default
+
+            stripe.entries.move_to_end(key)
+            stripe.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None, tags=()):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires_at = time.time() + timeout if timeout else None
+        size = _estimate_size(value)
+        tags = frozenset(tags)
+
+        stripe = self._stripe(key)
+        with stripe.lock:
+            # Values larger than the whole budget would only evict everything else
+            if size > self.max_bytes:
+                if key in stripe.entries:
+                    stripe.remove(key)
+                return False
+
+            if key in stripe.entries:
+                stripe.remove(key)
+            if tags:
+                self._link(key, tags)
+            stripe.entries[key] = (value, expires_at, size, tags)
+            stripe.bytes += size
+            self._account(size)
+
+            now = time.time()
+            if now >= stripe.next_sweep:
+                stripe.sweep(now)
+            stripe.evict(self._over_budget)
+        if self._over_budget():
+            self._enforce_budget(stripe)
+        return True
+
+    def delete(self, key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            if key in stripe.entries:
+                stripe.remove(key)
+                return True
+        return False
+
+    def invalidate_tags(self, *tags):
+        """Delete every entry carrying any of the given tags, returning how many were dropped"""
+        with self._tag_lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+
+        return sum(1 for key in keys if self.delete(key))
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+                self._account(-stripe.bytes)
+                stripe.bytes = 0
+        with self._tag_lock:
+            self._tags.clear()
+
+    def sweep(self):
+        """Drop expired entries from every segment"""
+        now = time.time()
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.sweep(now)
+
+    def stats(self):
+        """Aggregate counters across all segments"""
+        totals = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        with self._tag_lock:
+            totals["tags"] = len(self._tags)
+        for stripe in self._stripes:
+            with stripe.lock:
+                totals["entries"] += len(stripe.entries)
+                totals["bytes"] += stripe.bytes
+                totals["hits"] += stripe.hits
+                totals["misses"] += stripe.misses
+                totals["evictions"] += stripe.evictions
+                totals["expirations"] += stripe.expirations
+
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        return totals
+
+    def cached(self, timeout=None, key_prefix='', tags=()):
+        """
+        Memoize a function, keying entries by key_prefix plus its arguments
+
+        Args:
+            tags: Tags for every entry, or a callable taking the function's
+                arguments and returning the tags for that call
+        """
+        def decorator(f):
+            prefix = key_prefix or f"{f.__module__}.{f.__qualname__}"
+
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                cache_key = make_key(prefix, args, kwargs)
+                result = self.get(cache_key, _MISSING)
+                if result is _MISSING:
+                    result = f(*args, **kwargs)
+                    entry_tags = tags(*args, **kwargs) if callable(tags) else tags
+                    self.set(cache_key, result, timeout, tags=entry_tags)
+                return result
+            return decorated_function
+        return decorator
@@ -0,0 +1,322 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+import msgspec
+from firebase_admin import firestore
+
+from app.json_provider import firestore_enc_hook
+
+db = firestore.client()
+logger = logging.getLogger(__name__)
+
+# Collections mirrored by the feed
+FEED_COLLECTIONS = ("drivers", "teams")
+
+# Events kept for clients resuming with Last-Event-ID
+FEED_HISTORY = int(os.environ.get("CHANGE_FEED_HISTORY", 1000))
+
+# Open event streams per process; each one holds a server thread
+FEED_MAX_SUBSCRIBERS = int(os.environ.get("CHANGE_FEED_MAX_SUBSCRIBERS", 4))
+
+# Seconds between keepalive comments, and before a stream ends so the browser reconnects
+FEED_HEARTBEAT = 15
+FEED_MAX_DURATION = int(os.environ.get("CHANGE_FEED_MAX_DURATION", 300))
+
+# Seconds a subscriber waits for the initial snapshot of the collections
+FEED_READY_TIMEOUT = 10
+
+_encoder = msgspec.json.Encoder(enc_hook=firestore_enc_hook)
+
+
+def format_event(event, data, event_id=None):
+    """One Server-Sent Events message"""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    lines.append("data: " + _encoder.encode(data).decode("utf-8"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class ChangeFeed:
+    """
+    Live replica of the drivers and teams collections, fed by on_snapshot
+
+    One Firestore listener per collection per process keeps a copy of every
+    document and turns each change into a numbered event
+    ({"seq", "collection", "type", "id", "data"}). Browsers subscribe over
+    Server-Sent Events and apply the events to the lists they already show,
+    so a page view costs no Firestore query and nobody polls. The last
+    `history` events are kept so a reconnecting browser (Last-Event-ID)
+    catches up from where it left off; one that fell further behind gets a
+    fresh snapshot (or is told to reload) instead.
+
+    Sequence numbers are per process, so event IDs carry a random epoch and
+    a browser reconnecting to another worker is treated as not resumable.
+    Listeners start on first use and are restarted if Firestore closes them.
+
+    Args:
+        collections (tuple): Collections to mirror
+        history (int): Events kept for resuming clients
+        max_subscribers (int): Concurrent event streams allowed
+    """
+
+    def __init__(self, collections=FEED_COLLECTIONS, history=FEED_HISTORY,
+                 max_subscribers=FEED_MAX_SUBSCRIBERS):
+        self.collections = tuple(collections)
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Condition()
+        self._docs = {name: {} for name in self.collections}
+        self._ready = {name: threading.Event() for name in self.collections}
+        self._resync = set()
+        self._watches = {}
+        self._events = deque(maxlen=history)
+        self._seq = 0
+        self.epoch = secrets.token_hex(4)
+        self._subscribers = 0
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Register listener(changed_collections), called after each batch of changes"""
+        self._listeners.append(listener)
+        return listener
+
+    def start(self):
+        """Attach (or re-attach) the collection listeners; safe to call repeatedly"""
+        with self._lock:
+            for name in self.collections:
+                watch = self._watches.get(name)
+                if watch is not None and getattr(watch, "is_active", True):
+                    continue
+                if watch is not None:
+                    # The next initial snapshot is diffed against the replica
+                    logger.warning(f"Change feed listener for {name} stopped; restarting")
+                    self._resync.add(name)
+                self._watches[name] = db.collection(name).on_snapshot(self._on_snapshot(name))
+
+    def stop(self):
+        with self._lock:
+            watches, self._watches = self._watches, {}
+        for watch in watches.values():
+            watch.unsubscribe()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def ready(self, timeout=FEED_READY_TIMEOUT):
+        """Start the listeners and wait until every collection has loaded"""
+        self.start()
+        deadline = time.monotonic() + timeout
+        return all(event.wait(max(0.0, deadline - time.monotonic())) for event in self._ready.values())
+
+    def _on_snapshot(self, name):
+        def callback(docs, changes, read_time):
+            with self._lock:
+                before = self._seq
+                replica = self._docs[name]
+                if not self._ready[name].is_set() or name in self._resync:
+                    # First delivery of a listener: the full result set
+                    current = {doc.id: doc.to_dict() for doc in docs}
+                    if name in self._resync:
+                        self._resync.discard(name)
+                        for doc_id in replica.keys() - current.keys():
+                            self._append(name, "removed", doc_id, None)
+                        for doc_id, data in current.items():
+                            if replica.get(doc_id) != data:
+                                self._append(name, "added" if doc_id not in replica else "modified", doc_id, data)
+                    self._docs[name] = current
+                    self._ready[name].set()
+                else:
+                    for change in changes:
+                        doc = change.document
+                        kind = change.type.name.lower()
+                        if kind == "removed":
+                            replica.pop(doc.id, None)
+                            self._append(name, kind, doc.id, None)
+                        else:
+                            replica[doc.id] = doc.to_dict()
+                            self._append(name, kind, doc.id, replica[doc.id])
+                changed = self._seq != before
+                if changed:
+                    self._lock.notify_all()
+
+            if changed:
+                for listener in self._listeners:
+                    listener({name})
+        return callback
+
+    def _append(self, collection, kind, doc_id, data):
+        # Called with the lock held
+        self._seq += 1
+        self._events.append({"seq": self._seq, "collection": collection, "type": kind,
+                             "id": doc_id, "data": data})
+
+    def _decorate(self, collection, data):
+        # Drivers sent to browsers carry their team's name, resolved from the teams replica
+        if collection == "drivers" and data is not None and "teams" in self._docs:
+            team = self._docs["teams"].get(data.get("team_id")) or {}
+            data = {**data, "team_name": team.get("name")}
+        return data
+
+    def is_live(self, name):
+        """True once a collection has loaded and while its listener is running"""
+        with self._lock:
+            watch = self._watches.get(name)
+            return (self._ready[name].is_set() and watch is not None
+                    and getattr(watch, "is_active", True) and name not in self._resync)
+
+    def documents(self, name):
+        """The replica of one collection, {id: data}, plus the sequence number it reflects"""
+        with self._lock:
+            return self._seq, dict(self._docs[name])
+
+    def snapshot(self, *collections):
+        """Current documents of the collections plus the sequence number they reflect"""
+        with self._lock:
+            return self._seq, {
+                name: [{"id": doc_id, **self._decorate(name, data)} for doc_id, data in self._docs[name].items()]
+                for name in collections or self.collections
+            }
+
+    def events_after(self, seq):
+        """Events newer than seq, or None if some of them are no longer kept"""
+        with self._lock:
+            return self._events_after(seq)
+
+    def _events_after(self, seq):
+        if seq >= self._seq:
+            return []
+        if not self._events or self._events[0]["seq"] > seq + 1:
+            return None
+        return [event for event in self._events if event["seq"] > seq]
+
+    def _event_id(self, seq):
+        return f"{self.epoch}-{seq}"
+
+    def _parse_event_id(self, event_id):
+        # A seq from this process, or None (another worker, a restart, or garbage)
+        epoch, _, seq = (event_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, last_event_id=None, snapshot=False, max_duration=FEED_MAX_DURATION,
+                  heartbeat=FEED_HEARTBEAT):
+        """
+        An SSE byte stream for one browser, or None if at the subscriber limit
+
+        A new subscriber gets a "snapshot" event (with snapshot=True) or a
+        "ready" event, then "change" events. A resuming one gets the events
+        it missed, or, if they can't be replayed, a "snapshot" (snapshot=True)
+        or a "reset" telling it to reload what it shows.
+
+        Args:
+            last_event_id (str): Last-Event-ID sent by a reconnecting browser
+            snapshot (bool): Send the full collections when not resuming
+            max_duration (float): Seconds before the stream ends (the browser reconnects)
+            heartbeat (float): Seconds between keepalive comments
+
+        Raises:
+            TimeoutError: If the collections haven't loaded yet
+            Exception: Whatever starting the listeners raised (the slot is freed)
+        """
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                return None
+            self._subscribers += 1
+        subscription = _Subscription(self)
+        try:
+            if not self.ready():
+                raise TimeoutError("Change feed is not ready")
+        except Exception:
+            subscription.close()
+            raise
+        subscription.stream = self._stream(last_event_id, snapshot, max_duration, heartbeat)
+        return subscription
+
+    def _release(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    def _stream(self, last_event_id, snapshot, max_duration, heartbeat):
+        # Padding gets the stream past proxies that buffer the first few KB
+        yield f"retry: 3000\n: {' ' * 2048}\n\n".encode("utf-8")
+
+        seq = self._parse_event_id(last_event_id)
+        if seq is None or self.events_after(seq) is None:
+            if snapshot:
+                seq, data = self.snapshot()
+                yield format_event("snapshot", {"seq": seq, **data}, self._event_id(seq))
+            else:
+                seq = self.seq
+                yield format_event("reset" if last_event_id else "ready", {"seq": seq}, self._event_id(seq))
+
+        deadline = time.monotonic() + max_duration
+        while time.monotonic() < deadline:
+            with self._lock:
+                events = self._events_after(seq)
+                if events == []:
+                    self._lock.wait(min(heartbeat, max(0.0, deadline - time.monotonic())))
+                    events = self._events_after(seq)
+
+            if events is None:
+                # Fell behind the kept history: start over
+                if snapshot:
+                    seq, data = self.snapshot()
+                    yield format_event("snapshot", {"seq": seq, **data}, self._event_id(seq))
+                else:
+                    seq = self.seq
+                    yield format_event("reset", {"seq": seq}, self._event_id(seq))
+            elif events:
+                for event in events:
+                    event = {**event, "data": self._decorate(event["collection"], event["data"])}
+                    yield format_event("change", event, self._event_id(event["seq"]))
+                seq = events[-1]["seq"]
+            else:
+                yield b": keepalive\n\n"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "seq": self._seq,
+                "subscribers": self._subscribers,
+                "max_subscribers": self.max_subscribers,
+                "events_kept": len(self._events),
+                "listening": sorted(name for name, watch in self._watches.items()
+                                    if getattr(watch, "is_active", True)),
+                "documents": {name: len(docs) for name, docs in self._docs.items()},
+            }
+
+
+class _Subscription:
+    """One browser's event stream; closing it frees the subscriber slot"""
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.stream = None  # Set once the feed is ready
+        self._open = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.stream is None:
+            raise StopIteration
+        return next(self.stream)
+
+    def close(self):
+        # The slot is freed whatever closing the stream does
+        try:
+            if self.stream is not None:
+                self.stream.close()
+        finally:
+            if self._open:
+                self._open = False
+                self.feed._release()
+
+
+# Shared feed for the process
+change_feed = ChangeFeed()
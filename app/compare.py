@@ -0,0 +1,127 @@
+import numpy as np
+from firebase_admin import firestore
+
+from app.analytics import ANALYTICS_STATS, DriverArrays, rank_within, plain_number
+from app.cache import LRUCache
+from app.db_utils import batch_get
+from app.profiler import profiler
+
+db = firestore.client()
+
+# Stats compared across drivers; for every one of them a higher value ranks first
+COMPARE_STATS = ['age', 'race_wins', 'pole_positions', 'fastest_laps', 'world_titles']
+
+# Largest comparison served in one request (a full grid is 20 drivers)
+MAX_COMPARE_DRIVERS = 30
+
+# Computed rankings, keyed by the driver IDs and their stat values so an
+# edited driver can never be served from a stale entry
+comparison_cache = LRUCache(max_entries=512, default_timeout=600, stripes=4)
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def rank_stats(drivers, stats=COMPARE_STATS):
+    """
+    Rank drivers against each other on every stat
+
+    The drivers are loaded into DriverArrays, whose stat columns are kept
+    sorted, and every driver's rank and percentile on a stat come from one
+    vectorized binary search over its column (as analytics leaderboards do).
+    Ranks are competition ranks (ties share a rank, 1 = highest value);
+    percentiles are the share of the compared drivers below the value, with
+    ties counted as half. Drivers without a numeric value for a stat are
+    left out of its ranking, and their entries for it are null.
+
+    Args:
+        drivers (list): Driver dicts, each with an 'id'
+
+    Returns:
+        tuple: ({stat: summary}, {driver_id: {stat: ranking}})
+    """
+    arrays = DriverArrays(drivers)
+    summary = {}
+    rankings = {driver_id: {} for driver_id in arrays.ids}
+    unranked = {"value": None, "rank": None, "percentile": None, "delta_to_leader": None, "delta_to_mean": None}
+
+    for stat in stats:
+        values, ordered = arrays.column(stat), arrays.ordered(stat)
+        if not len(ordered):
+            summary[stat] = {"min": None, "max": None, "mean": None, "leaders": []}
+            for driver_id in arrays.ids:
+                rankings[driver_id][stat] = dict(unranked)
+            continue
+
+        best, mean = ordered[-1], ordered.mean()
+        ranks, percentiles = rank_within(ordered, values)
+        summary[stat] = {
+            "min": plain_number(ordered[0]),
+            "max": plain_number(best),
+            "mean": round(float(mean), 2),
+            "leaders": arrays.ids[values == best].tolist(),
+        }
+
+        for driver_id, value, rank, percentile in zip(arrays.ids, values, ranks, percentiles):
+            if np.isnan(value):
+                rankings[driver_id][stat] = dict(unranked)
+                continue
+            rankings[driver_id][stat] = {
+                "value": plain_number(value),
+                "rank": int(rank),
+                "percentile": round(float(percentile), 1),
+                "delta_to_leader": plain_number(value - best),
+                "delta_to_mean": round(float(value - mean), 2),
+            }
+    return summary, rankings
+
+
+@profiler.profile('compare.load_drivers', shape='get_all')
+def _load_drivers(driver_ids):
+    # batch_get unwrapped, so its reads are recorded once, under this operation
+    return batch_get.__wrapped__([db.collection('drivers').document(i) for i in driver_ids])
+
+
+def _head_to_head(driver1, driver2):
+    # Field names kept from the original two-driver endpoint
+    return {
+        "age_diff": abs(_number(driver1.get('age')) - _number(driver2.get('age'))),
+        "wins_diff": abs(_number(driver1.get('race_wins')) - _number(driver2.get('race_wins'))),
+        "poles_diff": abs(_number(driver1.get('pole_positions')) - _number(driver2.get('pole_positions'))),
+        "fastest_laps_diff": abs(_number(driver1.get('fastest_laps')) - _number(driver2.get('fastest_laps'))),
+        "titles_diff": abs(_number(driver1.get('world_titles')) - _number(driver2.get('world_titles'))),
+    }
+
+
+def compare_drivers(driver_ids):
+    """
+    Compare any number of drivers with a single batched read
+
+    Args:
+        driver_ids (list): Distinct driver IDs, in display order
+
+    Returns:
+        dict: The drivers, per-stat summaries and per-driver rankings, plus
+            the legacy driver1/driver2/comparison keys for two drivers
+
+    Raises:
+        LookupError: If any of the drivers doesn't exist (message names it)
+    """
+    loaded = _load_drivers(driver_ids)
+    for driver_id in driver_ids:
+        if loaded.get(driver_id) is None:
+            raise LookupError(f"Driver with ID {driver_id} not found")
+    drivers = [{**loaded[driver_id], "id": driver_id} for driver_id in driver_ids]
+
+    key = tuple((driver['id'],) + tuple(repr(driver.get(stat)) for stat in COMPARE_STATS) for driver in drivers)
+    ranked = comparison_cache.get(key)
+    if ranked is None:
+        ranked = rank_stats(drivers)
+        comparison_cache.set(key, ranked)
+
+    summary, rankings = ranked
+    result = {"drivers": drivers, "stats": summary, "rankings": rankings}
+    if len(drivers) == 2:
+        result.update(driver1=drivers[0], driver2=drivers[1], comparison=_head_to_head(*drivers))
+    return result
@@ -1,92 +1,136 @@
 from firebase_admin import firestore
 from flask import current_app
-import time
-from functools import wraps
+from google.api_core.exceptions import Aborted, GoogleAPICallError
+from itsdangerous import URLSafeSerializer, BadSignature
+
+from app.profiler import profiler, query_shape
+from app.singleflight import coalesce
+from app.stats import apply_stats_delta
+from app.versions import bump_version, collection_versions
+from app.search import driver_index
+from app.replica import driver_replica
 
 db = firestore.client()
 
-# Performance monitoring decorator
-def measure_time(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        start_time = time.time()
-        result = f(*args, **kwargs)
-        execution_time = time.time() - start_time
-        
-        # Log if query is slow (more than 500ms)
-        if execution_time > 0.5:
-            current_app.logger.warning(
-                f"Slow database operation: {f.__name__} took {execution_time:.2f}s with args: {args}, kwargs: {kwargs}"
-            )
-        return result
-    return decorated_function
+# Raised by update_driver/delete_driver; routes map them to 404, 403 and 409
+class DriverNotFound(LookupError):
+    pass
+
+class NotDriverOwner(PermissionError):
+    pass
+
+class DriverWriteConflict(Exception):
+    pass
+
+# Pagination cursors carry the last document's sort values, signed with the
+# app secret so clients can't forge them and no extra read is needed to resume
+def _cursor_serializer():
+    return URLSafeSerializer(current_app.secret_key, salt="drivers-cursor")
+
+def encode_cursor(name, doc_id):
+    """Build an opaque cursor resuming after the given (name, document ID) position"""
+    return _cursor_serializer().dumps([name, doc_id])
+
+def decode_cursor(cursor):
+    """Return the [name, document ID] pair stored in a cursor, or raise ValueError"""
+    try:
+        name, doc_id = _cursor_serializer().loads(cursor)
+    except (BadSignature, TypeError, ValueError):
+        raise ValueError("Invalid pagination cursor")
+    return name, doc_id
 
 # Implement pagination for drivers collection
-@measure_time
-def get_drivers(limit=10, start_after=None, filters=None):
+@coalesce('database.get_drivers')
+@profiler.profile('database.get_drivers')
+def get_drivers(limit=10, start_after=None, filters=None, fields=None):
     """
     Get drivers with pagination and optional filtering
     
     Args:
         limit (int): Maximum number of drivers to retrieve
-        start_after (str): Document ID to start after (for pagination)
+        start_after (str): Cursor returned by a previous call (for pagination)
         filters (dict): Optional filters like {'team_id': 'team123', 'min_wins': 5}
+        fields (list): Optional field projection pushed down to Firestore
     
     Returns:
-        tuple: (List of drivers, Last document for pagination)
+        tuple: (List of drivers, Cursor for the next page)
+
+    Raises:
+        ValueError: If start_after is not a valid cursor
     """
+    # Answered in-process when the drivers replica is on and fresh enough
+    if driver_replica.available():
+        profiler.annotate(shape="replica/drivers", reads=0)
+        drivers = driver_replica.page(limit, decode_cursor(start_after) if start_after else None,
+                                      filters, fields)
+        next_cursor = encode_cursor(drivers[-1].get('name'), drivers[-1]['id']) if drivers else None
+        return drivers, next_cursor
+
     query = db.collection("drivers")
+    shape_filters = []
     
     # Apply filters if provided
     if filters:
         if 'team_id' in filters and filters['team_id']:
             query = query.where('team_id', '==', filters['team_id'])
+            shape_filters.append(('team_id', '=='))
             
         if 'min_wins' in filters and filters['min_wins']:
             query = query.where('race_wins', '>=', int(filters['min_wins']))
+            shape_filters.append(('race_wins', '>='))
             
         if 'nationality' in filters and filters['nationality']:
             query = query.where('nationality', '==', filters['nationality'])
+            shape_filters.append(('nationality', '=='))
             
         if 'active' in filters:
             query = query.where('active', '==', filters['active'])
+            shape_filters.append(('active', '=='))
     
-    # Apply default sort (by name)
-    query = query.order_by('name')
+    # Apply default sort (by name, then document ID so equal names page stably)
+    query = query.order_by('name').order_by('__name__')
     
-    # Apply pagination
+    # Only fetch the requested fields (name is always needed for ordering)
+    if fields:
+        query = query.select(sorted(set(fields) | {'name'}))
+    
+    # Apply pagination directly on the sort values, no document lookup needed
     if start_after:
-        start_doc = db.collection("drivers").document(start_after).get()
-        if start_doc.exists:
-            query = query.start_after(start_doc)
+        name, doc_id = decode_cursor(start_after)
+        query = query.start_after({'name': name, '__name__': doc_id})
     
     # Limit results
     query = query.limit(limit)
+    profiler.annotate(shape=query_shape("drivers", shape_filters, ('name', '__name__'), fields, limit, bool(start_after)))
     
     # Execute query
     drivers_docs = query.stream()
     
-    # Convert to list and get last doc for pagination
+    # Convert to list and build the cursor from the last doc
     drivers = []
-    last_doc = None
-    
     for doc in drivers_docs:
         drivers.append({"id": doc.id, **doc.to_dict()})
-        last_doc = doc.id
     
-    return drivers, last_doc
+    next_cursor = None
+    if drivers:
+        last = drivers[-1]
+        next_cursor = encode_cursor(last.get('name'), last['id'])
+    
+    return drivers, next_cursor
 
 # Get driver by ID with caching considerations
-@measure_time
+@coalesce('database.get_driver')
+@profiler.profile('database.get_driver')
 def get_driver(driver_id):
     """Get a single driver by ID"""
     doc = db.collection("drivers").document(driver_id).get()
     if doc.exists:
-        return {"id": doc.id, **doc.to_dict()}
+        # update_time lets clients make conditional writes (sent back as If-Match)
+        return {"id": doc.id, **doc.to_dict(), "update_time": update_time_token(doc)}
     return None
 
 # Add a driver with proper validation
-@measure_time
+@profiler.profile('database.add_driver')
 def add_driver(data, user_id):
     """
     Add a new driver with validation and user tracking
@@ -106,14 +150,63 @@ def add_driver(data, user_id):
     data.setdefault('fastest_laps', 0)
     data.setdefault('active', True)
     
-    # Add document and return reference
-    doc_ref = db.collection("drivers").add(data)
-    return doc_ref[1].id  # Return the document ID
+    # Write the document and its stats increments atomically
+    doc_ref = db.collection("drivers").document()
+    batch = db.batch()
+    batch.set(doc_ref, data)
+    apply_stats_delta(batch, None, data)
+    bump_version(batch, "drivers")
+    with collection_versions.local_write("drivers"):
+        batch.commit()
+    profiler.annotate(writes=3)
+    driver_index.upsert(doc_ref.id, data)
+    return doc_ref.id  # Return the document ID
+
+def update_time_token(snapshot):
+    """Opaque version of a driver document, for clients to send back as expected_update_time"""
+    return snapshot.update_time.isoformat() if snapshot.update_time else None
+
+def _check_driver(snapshot, owner_id, expected_update_time):
+    """Existence, ownership and version checks, run inside the write transaction"""
+    if not snapshot.exists:
+        raise DriverNotFound(f"Driver {snapshot.id} not found")
+    
+    old = snapshot.to_dict()
+    if owner_id is not None and old.get('created_by') and old['created_by'] != owner_id:
+        raise NotDriverOwner(f"Driver {snapshot.id} belongs to another user")
+    if expected_update_time and update_time_token(snapshot) != expected_update_time:
+        raise DriverWriteConflict(f"Driver {snapshot.id} was changed by someone else")
+    return old
+
+def _run_driver_transaction(fn, doc_ref, *args):
+    try:
+        return fn(db.transaction(), doc_ref, *args)
+    except ValueError as e:
+        # Contention retries exhausted: the transaction wraps the last Aborted
+        if isinstance(e.__cause__, Aborted):
+            raise DriverWriteConflict(f"Driver {doc_ref.id} is being changed concurrently") from e
+        raise
 
 # Update a driver
-@measure_time
-def update_driver(driver_id, data, user_id):
-    """Update an existing driver"""
+@profiler.profile('database.update_driver')
+def update_driver(driver_id, data, user_id, owner_id=None, expected_update_time=None):
+    """
+    Update an existing driver in one transactional read-modify-write
+    
+    Args:
+        driver_id (str): Driver to update
+        data (dict): Fields to change
+        user_id (str): ID of the user making the change
+        owner_id (str): If given, only a driver created by this user may be changed
+        expected_update_time (str): If given, the update_time_token() the caller
+            last saw; the update fails if the driver changed since
+    
+    Returns:
+        dict: The driver as it was before the update
+    
+    Raises:
+        DriverNotFound, NotDriverOwner, DriverWriteConflict
+    """
     # Don't allow changing creation metadata
     if 'created_at' in data:
         del data['created_at']
@@ -124,63 +217,147 @@ def update_driver(driver_id, data, user_id):
     data['updated_at'] = firestore.SERVER_TIMESTAMP
     data['updated_by'] = user_id
     
-    # Update document
-    db.collection("drivers").document(driver_id).update(data)
-    return driver_id
+    # Checks, update and stats run in one transaction, so a concurrent write
+    # retries it against the new data instead of being overwritten
+    with collection_versions.local_write("drivers"):
+        old = _run_driver_transaction(_update_driver_transaction, db.collection("drivers").document(driver_id),
+                                      data, owner_id, expected_update_time)
+    profiler.annotate(writes=3)
+    # The whole driver as written, so no field the update left alone goes stale in the index
+    driver_index.upsert(driver_id, {**old, **data}, merge=False)
+    return old
+
+@firestore.transactional
+def _update_driver_transaction(transaction, doc_ref, data, owner_id, expected_update_time):
+    snapshot = doc_ref.get(transaction=transaction)
+    old = _check_driver(snapshot, owner_id, expected_update_time)
+    
+    transaction.update(doc_ref, data)
+    apply_stats_delta(transaction, old, {**old, **data})
+    bump_version(transaction, "drivers")
+    return old
 
 # Delete a driver
-@measure_time
-def delete_driver(driver_id):
-    """Delete a driver by ID"""
-    db.collection("drivers").document(driver_id).delete()
-    return driver_id
+@profiler.profile('database.delete_driver')
+def delete_driver(driver_id, owner_id=None, expected_update_time=None):
+    """
+    Delete a driver by ID, with the same checks as update_driver()
+    
+    Returns:
+        dict: The deleted driver
+    
+    Raises:
+        DriverNotFound, NotDriverOwner, DriverWriteConflict
+    """
+    with collection_versions.local_write("drivers"):
+        old = _run_driver_transaction(_delete_driver_transaction, db.collection("drivers").document(driver_id),
+                                      owner_id, expected_update_time)
+    profiler.annotate(writes=3)
+    driver_index.remove(driver_id)
+    return old
+
+@firestore.transactional
+def _delete_driver_transaction(transaction, doc_ref, owner_id, expected_update_time):
+    snapshot = doc_ref.get(transaction=transaction)
+    old = _check_driver(snapshot, owner_id, expected_update_time)
+    
+    transaction.delete(doc_ref)
+    apply_stats_delta(transaction, old, None)
+    bump_version(transaction, "drivers")
+    return old
 
 # Get all teams (usually a small collection, so pagination might not be needed)
-@measure_time
+@coalesce('database.get_teams')
+@profiler.profile('database.get_teams')
 def get_teams():
     """Get all teams"""
     teams = db.collection("teams").stream()
     return [{"id": doc.id, **doc.to_dict()} for doc in teams]
 
-# Stats and aggregation (efficient with batched reads)
-@measure_time
-def get_driver_stats():
-    """Get aggregated driver statistics"""
-    stats = {}
+# Page size for stats scans; only two small fields are projected per driver
+STATS_SCAN_PAGE_SIZE = 1000
+
+# Stats and aggregation
+@coalesce('database.get_driver_stats')
+@profiler.profile('database.get_driver_stats')
+def get_driver_stats(include_breakdown=True):
+    """
+    Get aggregated driver statistics
+    
+    Totals alone come from a single server-side count()/sum() aggregation
+    query. The per-team breakdown needs every driver's team, so it is computed
+    in one pass over a projected scan, which is also the fallback when
+    aggregation queries are unavailable (e.g. older emulators).
+    
+    Args:
+        include_breakdown (bool): Also compute drivers_by_team
+    
+    Returns:
+        dict: total_drivers, total_wins and (optionally) drivers_by_team
+    """
+    if not include_breakdown:
+        try:
+            return _aggregate_driver_totals()
+        except (AttributeError, GoogleAPICallError) as e:
+            current_app.logger.warning(f"Aggregation query failed, falling back to scan: {str(e)}")
+    
+    stats = _scan_driver_stats()
+    if not include_breakdown:
+        del stats['drivers_by_team']
+    return stats
+
+def _aggregate_driver_totals():
+    """Count drivers and sum their wins in one aggregation RPC"""
+    aggregate_query = (
+        db.collection("drivers")
+        .count(alias="total_drivers")
+        .sum("race_wins", alias="total_wins")
+    )
+    
+    totals = {"total_drivers": 0, "total_wins": 0}
+    for result in aggregate_query.get():
+        for aggregation in result:
+            totals[aggregation.alias] = int(aggregation.value or 0)
     
-    # Use batched reads for efficiency
-    batch_size = 10
-    drivers_ref = db.collection("drivers").limit(batch_size)
+    # Aggregations bill one read per 1000 index entries scanned (minimum one)
+    profiler.annotate(shape="drivers count,sum(race_wins)", reads=max(1, -(-totals["total_drivers"] // 1000)))
+    return totals
+
+def _scan_driver_stats(page_size=STATS_SCAN_PAGE_SIZE):
+    """Compute totals and per-team counts in a single pass over large projected pages"""
+    query = (
+        db.collection("drivers")
+        .select(["race_wins", "team_id"])
+        .order_by("__name__")
+        .limit(page_size)
+    )
     
-    # Calculate totals
     total_drivers = 0
     total_wins = 0
     drivers_by_team = {}
     
-    # Process in batches to avoid memory issues
-    docs = drivers_ref.stream()
-    batch = list(docs)
-    
-    while batch:
-        for doc in batch:
+    page = list(query.stream())
+    while page:
+        for doc in page:
             data = doc.to_dict()
             total_drivers += 1
-            total_wins += data.get('race_wins', 0)
+            wins = data.get('race_wins', 0)
+            if isinstance(wins, (int, float)):
+                total_wins += wins
             
-            # Count drivers by team
             team_id = data.get('team_id')
             if team_id:
-                if team_id not in drivers_by_team:
-                    drivers_by_team[team_id] = 0
-                drivers_by_team[team_id] += 1
+                drivers_by_team[team_id] = drivers_by_team.get(team_id, 0) + 1
         
-        # Get next batch
-        last = batch[-1]
-        docs = drivers_ref.start_after(last).stream()
-        batch = list(docs)
-    
-    stats['total_drivers'] = total_drivers
-    stats['total_wins'] = total_wins
-    stats['drivers_by_team'] = drivers_by_team
+        # A short page means the collection is exhausted
+        if len(page) < page_size:
+            break
+        page = list(query.start_after(page[-1]).stream())
     
-    return stats
+    profiler.annotate(shape=query_shape("drivers", fields=["race_wins", "team_id"], order_by=["__name__"], limit=page_size),
+                      reads=total_drivers)
+    return {
+        'total_drivers': total_drivers,
+        'total_wins': total_wins,
+        'drivers_by_team': drivers_by_team
+    }
@@ -1,9 +1,19 @@
 from firebase_admin import firestore
+from google.api_core.exceptions import (
+    Aborted, DeadlineExceeded, InternalServerError, ResourceExhausted, ServiceUnavailable
+)
+from google.cloud.firestore_v1.transforms import Increment
 from concurrent.futures import ThreadPoolExecutor
+import logging
+import random
 import time
 
+from app.profiler import profiler, estimate_bytes
+
 db = firestore.client()
+logger = logging.getLogger(__name__)
 
+@profiler.profile('db_utils.batch_get', shape='get_all')
 def batch_get(doc_refs):
     """Efficiently get multiple documents by reference"""
     # Use Firestore's built-in batched get
@@ -15,61 +25,133 @@ def batch_get(doc_refs):
             result[doc.id] = doc.to_dict()
         else:
             result[doc.id] = None
-            
+    
+    # Every requested document is billed as a read, found or not
+    profiler.annotate(reads=len(result), bytes=estimate_bytes([d for d in result.values() if d]))
     return result
 
-def batch_write(operations, max_batch_size=500):
+# Errors worth retrying any batch commit on: the commit was rejected, so
+# nothing in it was applied (contention, transient unavailability, quota)
+RETRYABLE_ERRORS = (Aborted, ServiceUnavailable, ResourceExhausted)
+
+# Errors after which the commit may or may not have been applied. Retrying is
+# only safe for batches that write the same result twice, i.e. that hold no
+# Increment transforms, which would be counted again
+AMBIGUOUS_ERRORS = (DeadlineExceeded, InternalServerError)
+
+def _has_increment(value):
+    if isinstance(value, Increment):
+        return True
+    if isinstance(value, dict):
+        return any(_has_increment(v) for v in value.values())
+    return False
+
+def is_idempotent(operations):
+    """Whether committing these (operation_type, ref, data) operations twice leaves the same documents as once"""
+    return not any(op_type != 'delete' and _has_increment(data) for op_type, _, data in operations)
+
+def batch_write(operations, max_batch_size=500, max_workers=1, max_retries=5, backoff=0.2):
     """
     Execute multiple write operations in batches
     
     Args:
         operations: List of (operation_type, ref, data) tuples
-            where operation_type is 'set', 'update', or 'delete'
+            where operation_type is 'set', 'merge' (set with merge=True), 'update', or 'delete'
         max_batch_size: Maximum batch size (Firestore limit is 500)
+        max_workers: Number of batches committed concurrently (1 = sequential)
+        max_retries: Retries per batch on contention/transient errors (timeouts
+            and internal errors only for batches without Increment transforms)
+        backoff: Base delay in seconds for exponential backoff between retries
+    
+    Returns:
+        list: One dict per batch, in order, with the batch's operation index
+            range ('start', 'end'), 'ok', 'attempts', 'elapsed' and 'error'
     """
     if not operations:
         return []
-        
-    result = []
-    batches = []
-    current_batch = db.batch()
-    current_batch_size = 0
-    
-    for op_type, ref, data in operations:
-        # If batch is full, commit and create new batch
-        if current_batch_size >= max_batch_size:
-            batches.append(current_batch)
-            current_batch = db.batch()
-            current_batch_size = 0
-            
-        # Add operation to current batch
-        if op_type == 'set':
-            current_batch.set(ref, data)
-        elif op_type == 'update':
-            current_batch.update(ref, data)
-        elif op_type == 'delete':
-            current_batch.delete(ref)
-        else:
+    
+    for op_type, _, _ in operations:
+        if op_type not in ('set', 'merge', 'update', 'delete'):
             raise ValueError(f"Unknown operation type: {op_type}")
-            
-        current_batch_size += 1
-        
-    # Add the last batch if it has operations
-    if current_batch_size > 0:
-        batches.append(current_batch)
-        
-    # Commit all batches
+    
+    # Split into chunks of operation indexes; each chunk becomes one batch
+    chunks = [
+        (start, min(start + max_batch_size, len(operations)))
+        for start in range(0, len(operations), max_batch_size)
+    ]
+    
+    def commit_chunk(index):
+        start, end = chunks[index]
+        return _commit_with_retry(index, start, end, operations[start:end], max_retries, backoff)
+    
     start_time = time.time()
     
-    for batch in batches:
-        batch.commit()
-        result.append(True)
+    if max_workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            result = list(executor.map(commit_chunk, range(len(chunks))))
+    else:
+        result = [commit_chunk(index) for index in range(len(chunks))]
     
     execution_time = time.time() - start_time
-    print(f"Batch operation completed in {execution_time:.2f}s")
+    failed = [r for r in result if not r['ok']]
+    log = logger.warning if failed else logger.info
+    log(
+        f"batch_write ops={len(operations)} batches={len(chunks)} failed_batches={len(failed)} "
+        f"workers={max_workers} elapsed={execution_time:.3f}s"
+    )
     
     return result
 
+def _commit_with_retry(index, start, end, operations, max_retries, backoff):
+    """Commit one batch, rebuilding and retrying it on retryable errors"""
+    attempts = 0
+    batch_start = time.time()
+    retryable = RETRYABLE_ERRORS + AMBIGUOUS_ERRORS if is_idempotent(operations) else RETRYABLE_ERRORS
+    
+    while True:
+        attempts += 1
+        batch = db.batch()
+        for op_type, ref, data in operations:
+            if op_type == 'set':
+                batch.set(ref, data)
+            elif op_type == 'merge':
+                batch.set(ref, data, merge=True)
+            elif op_type == 'update':
+                batch.update(ref, data)
+            else:
+                batch.delete(ref)
+        
+        try:
+            with profiler.operation('db_utils.batch_commit'):
+                batch.commit()
+                profiler.annotate(writes=len(operations))
+            error = None
+            break
+        except retryable as e:
+            if attempts > max_retries:
+                error = e
+                break
+            # Exponential backoff with jitter so parallel batches don't retry in lockstep
+            delay = backoff * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            logger.info(f"batch_write batch={index} attempt={attempts} retrying in {delay:.2f}s: {e}")
+            time.sleep(delay)
+        except Exception as e:
+            error = e
+            break
+    
+    if error is not None:
+        logger.error(f"batch_write batch={index} ops={start}-{end - 1} failed after {attempts} attempts: {error}")
+    
+    return {
+        "batch": index,
+        "start": start,
+        "end": end,
+        "ok": error is None,
+        "attempts": attempts,
+        "elapsed": round(time.time() - batch_start, 3),
+        "error": str(error) if error is not None else None,
+    }
+
 def parallel_operations(operations, max_workers=5):
     """
     Execute multiple independent Firestore operations in parallel
@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import os
+import zlib
+from functools import wraps
+
+from flask import make_response, request, session
+
+from app.versions import collection_versions
+
+# brotli is optional; gzip is always available
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# JSON bodies smaller than this aren't worth compressing
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+
+# Suffixes appended to an ETag per content encoding, so each variant's tag is distinct
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def _request_etag(collections, versions, vary_user):
+    parts = [",".join(collections), ",".join(str(v) for v in versions), request.full_path]
+    if vary_user:
+        user = getattr(request, "user", None) or session.get("user") or {}
+        parts.append(str(user.get("uid", "")))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for suffix in ENCODING_SUFFIXES:
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional(*collections, vary_user=False):
+    """
+    Serve a GET endpoint with a strong ETag derived from collection versions
+
+    The tag covers the collections' write counters and the full request URL
+    (plus the user when the response is per-user), so it can be checked
+    before the view runs: a matching If-None-Match gets a 304 without
+    touching Firestore, beyond the periodic read of the counters.
+
+    Args:
+        collections: Collections whose writes change the response
+        vary_user (bool): Include the signed-in user in the tag
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = _request_etag(collections, collection_versions.get(*collections), vary_user)
+            if _etag_matches(request.headers.get("If-None-Match"), etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Let browsers keep the body but revalidate it on every use
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return decorated_function
+    return decorator
+
+
+def _negotiate(accept_encoding, encodings=None):
+    """Pick br or gzip (or one of encodings) from an Accept-Encoding header, honouring q=0"""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    for encoding in encodings or (("br", "gzip") if brotli else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def init_compression(app, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL):
+    """Compress JSON responses of at least min_size bytes with br or gzip"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or "Content-Encoding" in response.headers or response.mimetype != "application/json"):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+
+        # Streamed bodies (large arrays) are gzipped chunk by chunk as they go out
+        if response.is_streamed:
+            if _negotiate(accept_encoding, ("gzip",)):
+                response.response = _gzip_stream(response.response, level)
+                response.headers["Content-Encoding"] = "gzip"
+                response.headers.pop("Content-Length", None)
+                etag, weak = response.get_etag()
+                if etag:
+                    response.set_etag(f"{etag}-gzip", weak)
+            return response
+
+        encoding = _negotiate(accept_encoding)
+        data = response.get_data()
+        if encoding is None or len(data) < min_size:
+            return response
+
+        if encoding == "br":
+            response.set_data(brotli.compress(data, quality=min(level, 11)))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers["Content-Encoding"] = encoding
+
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+    return compress_response
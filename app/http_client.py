@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Point at a local stand-in (e.g. the Firebase Auth emulator) by overriding this
+IDENTITY_TOOLKIT_URL = os.environ.get("IDENTITY_TOOLKIT_URL", "https://identitytoolkit.googleapis.com/v1")
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (
+    float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05)),
+    float(os.environ.get("HTTP_READ_TIMEOUT", 10)),
+)
+
+# Statuses worth another try; the sign-in calls are safe to repeat
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PooledHTTPClient:
+    """
+    Shared keep-alive HTTP session for calls to one upstream API
+
+    Connections are pooled per host and reused across requests and threads,
+    so only the first call pays for the TCP/TLS handshake. Every request has
+    connect/read timeouts, and connection errors and retryable statuses are
+    retried a bounded number of times with exponential backoff (honouring
+    Retry-After). Reads are never retried after the request was sent.
+
+    Args:
+        base_url (str): Prefix for the paths passed to post()/get()
+        pool_maxsize (int): Connections kept open per host
+        max_retries (int): Retries for connection errors and RETRY_STATUSES
+        backoff (float): Backoff factor between retries
+        timeout (tuple): Default (connect, read) timeout in seconds
+    """
+
+    def __init__(self, base_url, pool_maxsize=10, max_retries=2, backoff=0.3, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._metrics = {"requests": 0, "errors": 0, "retries": 0, "total_seconds": 0.0}
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "POST"]),
+            backoff_factor=backoff,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+    def mount(self, prefix, adapter):
+        """Route URLs starting with prefix through another transport adapter (e.g. in tests)"""
+        self.session.mount(prefix, adapter)
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(time.perf_counter() - start, error=True)
+            raise
+
+        retries = len(response.raw.retries.history) if getattr(response.raw, "retries", None) else 0
+        self._record(time.perf_counter() - start, retries=retries)
+        return response
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def _record(self, elapsed, error=False, retries=0):
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._metrics["errors"] += int(error)
+            self._metrics["retries"] += retries
+            self._metrics["total_seconds"] += elapsed
+
+    def stats(self):
+        """Request counts and how often pooled connections were reused"""
+        connections = 0
+        pooled_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+
+        with self._lock:
+            metrics = dict(self._metrics)
+        total = metrics.pop("total_seconds")
+        return {
+            **metrics,
+            "connections_opened": connections,
+            "connection_reuse_ratio": round(1 - connections / pooled_requests, 4) if pooled_requests else 0.0,
+            "avg_latency_ms": round(total / metrics["requests"] * 1000, 2) if metrics["requests"] else 0.0,
+        }
+
+
+# Shared client for the Firebase Identity Toolkit REST API
+identity_toolkit = PooledHTTPClient(IDENTITY_TOOLKIT_URL)
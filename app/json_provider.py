@@ -0,0 +1,107 @@
+import os
+from datetime import datetime
+
+import msgspec
+from flask import Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1.transforms import Sentinel, _ValueList, _NumericValue
+
+try:
+    from google.cloud.firestore_v1 import DocumentReference, GeoPoint
+except ImportError:  # older client libraries
+    from google.cloud.firestore_v1.document import DocumentReference
+    from google.cloud.firestore_v1._helpers import GeoPoint
+
+# Full lists at least this long are streamed instead of encoded in one piece
+JSON_STREAM_THRESHOLD = int(os.environ.get("JSON_STREAM_THRESHOLD", 5000))
+
+# Items encoded per chunk of a streamed array
+JSON_STREAM_CHUNK_SIZE = 500
+
+
+def firestore_enc_hook(obj):
+    """Encode the Firestore types msgspec doesn't know about"""
+    if isinstance(obj, DatetimeWithNanoseconds):
+        if obj.nanosecond % 1000:
+            return obj.rfc3339()
+        # Microsecond precision fits a plain datetime, which msgspec encodes natively
+        # (rfc3339() is several times slower and dominates large lists)
+        return datetime(obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second,
+                        obj.microsecond, obj.tzinfo)
+    if isinstance(obj, DocumentReference):
+        return obj.path
+    if isinstance(obj, GeoPoint):
+        return {"latitude": obj.latitude, "longitude": obj.longitude}
+    if isinstance(obj, (Sentinel, _ValueList, _NumericValue)):
+        # SERVER_TIMESTAMP, Increment and friends have no value until Firestore applies them
+        return None
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_default_encoder = msgspec.json.Encoder(enc_hook=firestore_enc_hook)
+
+
+class MsgspecJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by msgspec
+
+    Encodes several times faster than the standard library and handles
+    Firestore timestamps (RFC 3339 with nanoseconds), document references,
+    geo points and unresolved write sentinels. Datetimes are emitted as
+    RFC 3339 rather than Flask's HTTP-date strings. Keys keep their insertion
+    order unless sort_keys is set.
+    """
+
+    sort_keys = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._sorted_encoder = msgspec.json.Encoder(enc_hook=firestore_enc_hook, order="sorted")
+
+    def _pick_encoder(self, sort_keys=None):
+        return self._sorted_encoder if (self.sort_keys if sort_keys is None else sort_keys) else _default_encoder
+
+    def dumps(self, obj, **kwargs):
+        return self._pick_encoder(kwargs.get("sort_keys")).encode(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        try:
+            return msgspec.json.decode(s)
+        except msgspec.DecodeError as e:
+            # Flask turns ValueError into a 400 Bad Request
+            raise ValueError(str(e)) from e
+
+    def response(self, *args, **kwargs):
+        # Encode straight to bytes; no str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._pick_encoder().encode(obj) + b"\n", mimetype=self.mimetype)
+
+
+def iter_json_array(items, chunk_size=JSON_STREAM_CHUNK_SIZE):
+    """Yield a JSON array of items as byte chunks of up to chunk_size items"""
+    yield b"["
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield (b"" if first else b",") + _default_encoder.encode(chunk)[1:-1]
+            first = False
+            chunk = []
+    if chunk:
+        yield (b"" if first else b",") + _default_encoder.encode(chunk)[1:-1]
+    yield b"]\n"
+
+
+def stream_json_array(items, chunk_size=JSON_STREAM_CHUNK_SIZE):
+    """A streamed application/json response of a (possibly lazy) list of items"""
+    return Response(stream_with_context(iter_json_array(items, chunk_size)), mimetype="application/json")
+
+
+def init_json(app):
+    """Use the msgspec provider for jsonify() and request.get_json()"""
+    app.json = MsgspecJSONProvider(app)
+    return app.json
@@ -0,0 +1,270 @@
+import atexit
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qsl
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+logger = logging.getLogger(__name__)
+
+# Where rate limit counters live. redis://host:6379 shares them between every
+# instance; the SQLite file only between the workers of one instance
+LIMITER_STORAGE_URI = os.environ.get(
+    "RATELIMIT_STORAGE_URI",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "f1-datahub-ratelimits.sqlite3")
+)
+
+# Stores only shared by the processes of one instance
+PER_INSTANCE_SCHEMES = ("sqlite", "memory")
+
+# Set on App Engine (GAE_ENV) and Cloud Run (K_SERVICE), where requests are
+# spread over several instances with separate disks
+MULTI_INSTANCE = bool(os.environ.get("GAE_ENV") or os.environ.get("K_SERVICE"))
+
+if MULTI_INSTANCE and LIMITER_STORAGE_URI.partition(":")[0] in PER_INSTANCE_SCHEMES:
+    # The app still starts, but each instance enforces the limits alone,
+    # multiplying them by the instance count
+    logger.error(
+        "RATELIMIT_STORAGE_URI is not a store shared by every instance (e.g. redis://host:6379): "
+        "rate limits are enforced per instance, so clients get up to max_instances times the configured limits"
+    )
+
+# Sliding windows don't let a burst through at every window boundary, as fixed windows do
+LIMITER_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter")
+
+# Seconds a process may hold hits reserved ahead of use before returning the
+# unused ones (0 reserves none: every hit is a write)
+LIMITER_LEASE_SECONDS = float(os.environ.get("RATELIMIT_LEASE_SECONDS", 1.0))
+
+# Share of a window's remaining hits one reservation may take beyond the hit itself
+LIMITER_LEASE_FRACTION = 0.1
+
+# Seconds between sweeps of expired counters
+PURGE_INTERVAL = 60
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Rate limit storage in a SQLite file, shared by every process on the host
+
+    Registered for sqlite:///path URIs, so Flask-Limiter picks it up from
+    storage_uri. Counters are rows of (key, count, expires_at); a hit is
+    checked and counted in one write transaction, so two processes can't
+    both take the last slot of a window.
+
+    To keep that write off most requests, a hit that finds plenty of room
+    also reserves a share (lease_fraction) of what is left of the window
+    for its process. Later hits spend the reservation without touching the
+    file, and whatever is unused after lease_seconds is given back. Reserved
+    hits count as used for everyone else, so this can only make a limit
+    briefly stricter, never looser, and near the limit every hit is a write.
+
+    Options (keyword arguments or URI query parameters):
+        lease_seconds (float): Seconds reserved hits are held before unused ones are returned
+        lease_fraction (float): Share of the remaining hits one reservation may take
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, lease_seconds=LIMITER_LEASE_SECONDS,
+                 lease_fraction=LIMITER_LEASE_FRACTION, **options):
+        path, _, query = uri[len("sqlite:///"):].partition("?")
+        if not path:
+            raise ValueError("sqlite storage needs a file path: sqlite:///path/to/file")
+        params = dict(parse_qsl(query))
+        self.path = path
+        self.lease_seconds = float(params.get("lease_seconds", lease_seconds))
+        self.lease_fraction = float(params.get("lease_fraction", lease_fraction))
+
+        self._local = threading.local()
+        self._lease_lock = threading.Lock()
+        self._leases = {}    # window key -> [unused reserved hits, returned at]
+        self._timer = None
+        self._purged_at = 0.0
+        self._leased = 0
+        self._checked = 0
+        self._returned = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS counters ("
+                         "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS counters_expires_at ON counters (expires_at)")
+        # Hand back reservations when the worker exits rather than leave them counted
+        atexit.register(self.release, True)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # Database access
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _read(conn, key, now):
+        row = conn.execute("SELECT count FROM counters WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        return row[0] if row else 0
+
+    def _add(self, conn, key, expiry, amount, now, elastic_expiry=False):
+        if now - self._purged_at > PURGE_INTERVAL:
+            self._purged_at = now
+            conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        # An expired row starts over, as if it had been deleted
+        return conn.execute(
+            "INSERT INTO counters (key, count, expires_at) VALUES (:key, :amount, :expires_at) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "count = CASE WHEN expires_at > :now THEN count + :amount ELSE :amount END, "
+            "expires_at = CASE WHEN expires_at <= :now OR :elastic THEN :expires_at ELSE expires_at END "
+            "RETURNING count",
+            {"key": key, "amount": amount, "expires_at": now + expiry, "now": now, "elastic": elastic_expiry}
+        ).fetchone()[0]
+
+    # Reservations
+
+    def _spend(self, key, amount, now):
+        with self._lease_lock:
+            lease = self._leases.get(key)
+            if lease is None or lease[0] < amount or lease[1] <= now:
+                return False
+            lease[0] -= amount
+            self._leased += 1
+            return True
+
+    def _reserve(self, key, hits, now):
+        with self._lease_lock:
+            lease = self._leases.setdefault(key, [0, now + self.lease_seconds])
+            lease[0] += hits
+            if self._timer is None or not self._timer.is_alive():
+                self._timer = threading.Timer(self.lease_seconds, self.release)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def release(self, everything=False):
+        """Return the unused hits of reservations that are due (or of all of them) in one transaction"""
+        now = time.time()
+        with self._lease_lock:
+            due = {key: lease for key, lease in self._leases.items() if everything or lease[1] <= now}
+            for key in due:
+                del self._leases[key]
+            if self._leases and not everything:
+                self._timer = threading.Timer(self.lease_seconds, self.release)
+                self._timer.daemon = True
+                self._timer.start()
+        unused = {key: lease[0] for key, lease in due.items() if lease[0] > 0}
+        if not unused:
+            return
+        with self._transaction() as conn:
+            conn.executemany("UPDATE counters SET count = MAX(count - ?, 0) WHERE key = ? AND expires_at > ?",
+                             [(hits, key, now) for key, hits in unused.items()])
+        self._returned += sum(unused.values())
+
+    # Storage interface
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self._transaction() as conn:
+            return self._add(conn, key, expiry, amount, now, elastic_expiry)
+
+    def get(self, key):
+        return self._read(self._connection(), key, time.time())
+
+    def get_expiry(self, key):
+        row = self._connection().execute("SELECT expires_at FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row and row[0] > time.time() else time.time()
+
+    def check(self):
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._lease_lock:
+            self._leases.clear()
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM counters").rowcount
+
+    def clear(self, key):
+        with self._lease_lock:
+            self._leases.pop(key, None)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM counters WHERE key = ?", (key,))
+
+    # Sliding window counter strategy
+
+    @staticmethod
+    def _window(previous_count, current_count, expiry, now):
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        if self._spend(current_key, amount, now):
+            return True
+
+        with self._transaction() as conn:
+            previous_count = self._read(conn, previous_key, now)
+            current_count = self._read(conn, current_key, now)
+            _, previous_ttl, _, _ = self._window(previous_count, current_count, expiry, now)
+            remaining = limit - math.floor(previous_count * previous_ttl / expiry + current_count)
+            if amount > remaining:
+                allowed, extra = False, 0
+            else:
+                allowed = True
+                extra = int((remaining - amount) * self.lease_fraction) if self.lease_seconds > 0 else 0
+                # Twice the window, so the count is still there while it's the previous one
+                self._add(conn, current_key, 2 * expiry, amount + extra, now)
+        self._checked += 1
+        if extra:
+            self._reserve(current_key, extra, now)
+        return allowed
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        conn = self._connection()
+        return self._window(self._read(conn, previous_key, now), self._read(conn, current_key, now), expiry, now)
+
+    def stats(self):
+        with self._lease_lock:
+            reserved = sum(lease[0] for lease in self._leases.values())
+        return {
+            "path": self.path,
+            "lease_seconds": self.lease_seconds,
+            "hits_from_reservations": self._leased,
+            "hits_checked": self._checked,
+            "hits_returned": self._returned,
+            "hits_reserved": reserved,
+        }
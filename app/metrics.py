@@ -0,0 +1,385 @@
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited workers' files are kept rather than folded
+    fcntl = None
+
+# Latency buckets (seconds) and response size buckets (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by endpoint, method and status", None),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by endpoint", LATENCY_BUCKETS),
+    "http_response_size_bytes": ("histogram", "HTTP response body size by endpoint", SIZE_BUCKETS),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled", None),
+    "http_rate_limited_total": ("counter", "Requests rejected by the rate limiter (429)", None),
+    "cache_hits_total": ("counter", "In-process cache hits", None),
+    "cache_misses_total": ("counter", "In-process cache misses", None),
+    "cache_evictions_total": ("counter", "In-process cache evictions", None),
+    "cache_entries": ("gauge", "Entries held by in-process caches", None),
+}
+
+# With several gunicorn workers, each writes its samples here and /metrics merges them
+METRICS_DIR = os.environ.get("METRICS_DIR")
+
+# Seconds between a worker's snapshot writes (it also writes on every scrape)
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+# Scrapes must send "Authorization: Bearer <token>"; without a token /metrics answers 404
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Totals of exited workers, folded out of their per-process files
+RETIRED_FILE = "metrics_retired.json"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_start(pid):
+    """When the process started, in clock ticks since boot (None where /proc isn't available)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; starttime is the 22nd field
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _merge(payloads, gauges=True, into=None):
+    """Sum the samples of several snapshot files into (values, histograms)"""
+    values, histograms = into or ({}, {})
+    for payload in payloads:
+        for name, labels, value in payload["values"]:
+            if METRICS[name][0] == "gauge" and not gauges:
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, samples in payload["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [0] * len(samples))
+            for i, sample in enumerate(samples):
+                merged[i] += sample
+    return values, histograms
+
+
+class MetricsRegistry:
+    """
+    Request metrics rendered in the Prometheus text exposition format
+
+    Counters and histograms live in process memory. When a directory is
+    configured (METRICS_DIR), every process periodically writes its samples
+    to its own <dir>/metrics_<pid>_<start>.json and a scrape of any worker
+    merges all files: counters and histograms are summed while gauges only
+    count live processes. The start time (or a random token) in the name
+    means a reused pid never overwrites an exited worker's totals. A worker
+    folds its counts into the retired totals file when it exits, and every
+    process folds the files of workers that died without doing so on its
+    first write, so totals never go backwards and files don't pile up.
+
+    Args:
+        directory (str): Shared directory for multi-worker deployments, or None
+        flush_interval (float): Seconds between snapshot writes
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._values = {}      # (name, labels) -> counter or gauge value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors = []
+        self._last_flush = 0.0
+        self._pid = None
+        self._retired = False
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # Keep the final counts of a worker that exits between flushes
+            atexit.register(self.retire)
+
+    def _identity(self):
+        # Worked out per pid, as the registry may be created before gunicorn forks
+        pid = os.getpid()
+        if self._pid != pid:
+            self._started = _process_start(pid)
+            self._path = os.path.join(self.directory,
+                                      f"metrics_{pid}_{self._started or uuid.uuid4().hex}.json")
+            self._pid = pid
+        return pid, self._started, self._path
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        key = (name, tuple(labels))
+        with self._lock:
+            samples = self._histograms.get(key)
+            if samples is None:
+                samples = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    samples[i] += 1
+                    break
+            samples[-2] += value
+            samples[-1] += 1
+
+    def add_cache(self, name, source):
+        """Export hits/misses/evictions/entries from an object with a stats() dict"""
+        def collect():
+            stats = source.stats()
+            labels = (("cache", name),)
+            return [
+                ("cache_hits_total", labels, stats.get("hits", 0)),
+                ("cache_misses_total", labels, stats.get("misses", 0)),
+                ("cache_evictions_total", labels, stats.get("evictions", 0)),
+                ("cache_entries", labels, stats.get("entries", 0)),
+            ]
+        self._collectors.append(collect)
+
+    def _snapshot(self):
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: list(samples) for key, samples in self._histograms.items()}
+        # Collected values are totals already, so they replace rather than add
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                values[(name, tuple(labels))] = value
+        return values, histograms
+
+    def flush(self, force=False):
+        """Write this process's samples to the shared directory (rate limited unless forced)"""
+        if not self.directory or self._retired:
+            return
+        now = time.time()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+
+        if self._pid != os.getpid():
+            # This process's first write: clean up after workers that died without retiring
+            self.prune()
+        pid, started, path = self._identity()
+        values, histograms = self._snapshot()
+        payload = {
+            "pid": pid,
+            "started": started,
+            "values": [[name, labels, value] for (name, labels), value in values.items()],
+            "histograms": [[name, labels, samples] for (name, labels), samples in histograms.items()],
+        }
+        _write_json(path, payload)
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        # Scrapes read under a shared lock, so they never see a file both
+        # folded into the retired totals and still in place (or neither)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, "metrics.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _files(self):
+        """(path, payload) of every per-process file in the directory"""
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith("metrics_") and filename.endswith(".json")) or filename == RETIRED_FILE:
+                continue
+            path = os.path.join(self.directory, filename)
+            payload = _read_json(path)
+            if payload is not None:
+                yield path, payload
+
+    @staticmethod
+    def _alive(payload):
+        if not _pid_alive(payload["pid"]):
+            return False
+        # A live pid may belong to a newer process that reused it
+        started = payload.get("started")
+        return started is None or _process_start(payload["pid"]) in (None, started)
+
+    def prune(self, own=False):
+        """
+        Fold the counters and histograms of exited workers (and, with own,
+        of this process) into the retired totals and delete their files
+        """
+        if not self.directory or fcntl is None:
+            return
+        own_path = self._identity()[2] if own else None
+        with self._locked(exclusive=True):
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            retired = _read_json(retired_path) or {"values": [], "histograms": []}
+            dead = [(path, payload) for path, payload in self._files()
+                    if path == own_path or not self._alive(payload)]
+            if not dead:
+                return
+            values, histograms = _merge([retired] + [payload for _, payload in dead], gauges=False)
+
+            _write_json(retired_path, {
+                "values": [[name, labels, value] for (name, labels), value in values.items()],
+                "histograms": [[name, labels, samples] for (name, labels), samples in histograms.items()],
+            })
+            for path, _ in dead:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def retire(self):
+        """Write this process's final counts and fold them into the retired totals (at exit)"""
+        self.flush(force=True)
+        # A late flush would put the folded counts back and count them twice
+        self._retired = fcntl is not None
+        self.prune(own=True)
+
+    def _merged(self):
+        if not self.directory:
+            return self._snapshot()
+
+        self.flush(force=True)
+        with self._locked():
+            payloads = [payload for _, payload in self._files()]
+            retired = _read_json(os.path.join(self.directory, RETIRED_FILE))
+        live, dead = [], []
+        for payload in payloads:
+            (live if self._alive(payload) else dead).append(payload)
+        if retired is not None:
+            dead.append(retired)
+
+        return _merge(dead, gauges=False, into=_merge(live))
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        values, histograms = self._merged()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for (sample_name, labels), samples in sorted(histograms.items()):
+                    if sample_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets, samples):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {samples[-1]}")
+                    lines.append(f"{name}_sum{_labels(labels)} {samples[-2]}")
+                    lines.append(f"{name}_count{_labels(labels)} {samples[-1]}")
+            else:
+                for (sample_name, labels), value in sorted(values.items()):
+                    if sample_name == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def init_metrics(app, registry=None, token=METRICS_TOKEN, limiter=None):
+    """
+    Record request metrics for an app and serve them at /metrics
+
+    Scrapes need "Authorization: Bearer <token>" with METRICS_TOKEN; while
+    no token is configured the endpoint answers 404, so metrics are never
+    public by accident.
+
+    Args:
+        limiter (Limiter): The app's rate limiter, exempting /metrics from
+            its default limits so a scraper polling every few seconds isn't cut off
+    """
+    registry = registry or metrics
+
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_in_flight = True
+        registry.inc("http_requests_in_flight")
+
+    # Run ahead of other hooks (e.g. the rate limiter) so rejected requests are timed too
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request_timer)
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        # Unmatched URLs share one label so scans can't explode the series count
+        endpoint = request.endpoint or "unmatched"
+        registry.inc("http_requests_total", (("endpoint", endpoint), ("method", request.method),
+                                             ("status", response.status_code)))
+        registry.observe("http_request_duration_seconds", time.perf_counter() - start,
+                         (("endpoint", endpoint), ("method", request.method)))
+        if not response.direct_passthrough and not response.is_streamed:
+            registry.observe("http_response_size_bytes", response.calculate_content_length() or 0,
+                             (("endpoint", endpoint),))
+        if response.status_code == 429:
+            registry.inc("http_rate_limited_total", (("endpoint", endpoint),))
+        return response
+
+    @app.teardown_request
+    def finish_request(exc=None):
+        if g.pop("metrics_in_flight", False):
+            registry.inc("http_requests_in_flight", amount=-1)
+        registry.flush()
+
+    def metrics_endpoint():
+        if not token:
+            return Response("Not Found\n", status=404, mimetype="text/plain")
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    if limiter is not None:
+        metrics_endpoint = limiter.exempt(metrics_endpoint)
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
+    return registry
+
+
+# Shared registry for the process
+metrics = MetricsRegistry()
@@ -0,0 +1,250 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Operations slower than this are logged and kept in the slow-query list
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 500))
+
+# Share of operations whose query shape is logged at debug level
+QUERY_SHAPE_SAMPLE_RATE = float(os.environ.get("QUERY_SHAPE_SAMPLE_RATE", 0.01))
+
+
+def query_shape(collection, filters=(), order_by=(), fields=None, limit=None, cursor=False):
+    """
+    Describe a query by its structure only, e.g.
+    "drivers where team_id == ? order_by name limit 10"
+
+    Filter values are never included, so shapes are safe to log.
+
+    Args:
+        filters: (field, op) pairs
+    """
+    parts = [collection]
+    if fields:
+        parts.append("select " + ",".join(sorted(fields)))
+    if filters:
+        parts.append("where " + " and ".join(f"{field} {op} ?" for field, op in filters))
+    if order_by:
+        parts.append("order_by " + ",".join(order_by))
+    if cursor:
+        parts.append("start_after ?")
+    if limit is not None:
+        parts.append(f"limit {limit}")
+    return " ".join(parts)
+
+
+def estimate_bytes(value):
+    """Rough in-memory size of returned document data (strings by length, scalars as 8)"""
+    if isinstance(value, dict):
+        return sum(len(str(key)) + estimate_bytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_bytes(item) for item in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 8
+
+
+def _count_documents(result):
+    # get_drivers-style (documents, cursor) pairs, document lists or one document
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0]), result[0]
+    if isinstance(result, list):
+        return len(result), result
+    if isinstance(result, dict):
+        return 1, result
+    return 0, None
+
+
+class _Operation:
+    __slots__ = ("name", "shape", "reads", "writes", "bytes")
+
+    def __init__(self, name, shape=None):
+        self.name = name
+        self.shape = shape
+        self.reads = None
+        self.writes = 0
+        self.bytes = None
+
+
+class QueryProfiler:
+    """
+    Per-operation latency, read/write and payload statistics for Firestore calls
+
+    Wrap operations with profile() (decorator) or operation() (context
+    manager). Reads and bytes are inferred from what the operation returns
+    unless set explicitly with annotate(), which also records writes and the
+    query shape. Aggregates are kept per operation and per Flask endpoint, so
+    the read bill can be traced back to the routes that cause it. Arguments
+    are never logged; slow operations are logged with their query shape.
+
+    Args:
+        slow_threshold_ms (float): Operations at or above this are logged as slow
+        sample_rate (float): Share of operations whose shape is logged at debug level
+        keep_slow (int): Number of recent slow operations kept for the endpoint
+    """
+
+    def __init__(self, slow_threshold_ms=SLOW_QUERY_THRESHOLD_MS, sample_rate=QUERY_SHAPE_SAMPLE_RATE, keep_slow=50):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._operations = {}
+        self._routes = {}
+        self._slow = deque(maxlen=keep_slow)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def annotate(self, shape=None, reads=None, writes=None, bytes=None):
+        """Attach details to the innermost operation running on this thread"""
+        stack = self._stack()
+        if not stack:
+            return
+        op = stack[-1]
+        if shape is not None:
+            op.shape = shape
+        if reads is not None:
+            op.reads = reads
+        if writes is not None:
+            op.writes += writes
+        if bytes is not None:
+            op.bytes = bytes
+
+    def operation(self, name, shape=None):
+        """Context manager profiling the enclosed block as one operation"""
+        return _OperationContext(self, name, shape)
+
+    def profile(self, name=None, shape=None):
+        """Decorator profiling every call of a function; reads are inferred from its result"""
+        def decorator(f):
+            op_name = name or f"{f.__module__}.{f.__name__}"
+
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                with self.operation(op_name, shape) as op:
+                    result = f(*args, **kwargs)
+                    if op.reads is None or op.bytes is None:
+                        count, documents = _count_documents(result)
+                        if op.reads is None:
+                            op.reads = count
+                        if op.bytes is None:
+                            op.bytes = estimate_bytes(documents) if documents is not None else 0
+                    return result
+            return wrapper
+        return decorator
+
+    def _record(self, op, elapsed_ms, error):
+        route = (request.endpoint or request.path) if has_request_context() else "background"
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        reads, size = op.reads or 0, op.bytes or 0
+
+        with self._lock:
+            stats = self._operations.get(op.name)
+            if stats is None:
+                stats = self._operations[op.name] = {
+                    "calls": 0, "errors": 0, "reads": 0, "writes": 0, "bytes": 0,
+                    "total_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["reads"] += reads
+            stats["writes"] += op.writes
+            stats["bytes"] += size
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["buckets"][bucket] += 1
+
+            route_stats = self._routes.setdefault(route, {"operations": 0, "reads": 0, "writes": 0, "ms": 0.0})
+            route_stats["operations"] += 1
+            route_stats["reads"] += reads
+            route_stats["writes"] += op.writes
+            route_stats["ms"] += elapsed_ms
+
+            slow = elapsed_ms >= self.slow_threshold_ms
+            if slow:
+                self._slow.append({
+                    "operation": op.name, "shape": op.shape, "route": route,
+                    "ms": round(elapsed_ms, 1), "reads": reads, "at": time.time(),
+                })
+
+        if slow:
+            logger.warning(f"slow_query operation={op.name} ms={elapsed_ms:.1f} reads={reads} "
+                           f"writes={op.writes} route={route} shape={op.shape!r}")
+        elif op.shape and random.random() < self.sample_rate:
+            logger.debug(f"query_shape operation={op.name} ms={elapsed_ms:.1f} reads={reads} shape={op.shape!r}")
+
+    @staticmethod
+    def _percentile(buckets, calls, fraction):
+        # Upper bound of the bucket holding the given fraction of calls
+        target = fraction * calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (None,), buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def stats(self):
+        with self._lock:
+            operations = {name: dict(stats, buckets=list(stats["buckets"])) for name, stats in self._operations.items()}
+            routes = {route: dict(stats) for route, stats in self._routes.items()}
+            slow = list(self._slow)
+
+        for stats in operations.values():
+            buckets = stats.pop("buckets")
+            labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+            stats["histogram"] = dict(zip(labels, buckets))
+            stats["p50_ms"] = self._percentile(buckets, stats["calls"], 0.5)
+            stats["p95_ms"] = self._percentile(buckets, stats["calls"], 0.95)
+            stats["avg_ms"] = round(stats.pop("total_ms") / stats["calls"], 2)
+            stats["max_ms"] = round(stats["max_ms"], 2)
+        for stats in routes.values():
+            stats["ms"] = round(stats["ms"], 2)
+
+        return {
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "operations": operations,
+            "routes": routes,
+            "slow_queries": slow,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._routes.clear()
+            self._slow.clear()
+
+
+class _OperationContext:
+    def __init__(self, profiler, name, shape):
+        self._profiler = profiler
+        self._op = _Operation(name, shape)
+
+    def __enter__(self):
+        self._profiler._stack().append(self._op)
+        self._start = time.perf_counter()
+        return self._op
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._start) * 1000
+        self._profiler._stack().pop()
+        self._profiler._record(self._op, elapsed_ms, error=exc_type is not None)
+        return False
+
+
+# Shared profiler for the process
+profiler = QueryProfiler()
@@ -0,0 +1,361 @@
+import bisect
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+
+from firebase_admin import firestore
+
+from app.change_feed import change_feed
+from app.profiler import profiler
+from app.versions import collection_versions
+
+db = firestore.client()
+logger = logging.getLogger(__name__)
+
+# "off" (default), "versions" (reload when the drivers write counter moves)
+# or "feed" (apply the on_snapshot change feed as it arrives)
+REPLICA_MODE = os.environ.get("DRIVER_REPLICA", "off").lower()
+
+# Seconds the replica may lag Firestore before reads fall back to it
+REPLICA_MAX_STALENESS = float(os.environ.get("DRIVER_REPLICA_MAX_STALENESS", 5))
+
+# Equality filters answered from hash indexes, and the one range filter (min_wins)
+HASH_INDEXED = ("team_id", "nationality", "active", "age", "race_wins",
+                "pole_positions", "fastest_laps", "world_titles")
+RANGE_INDEXED = "race_wins"
+
+# Filters understood by page(), as in database.get_drivers
+PAGE_FILTERS = ("team_id", "min_wins", "nationality", "active")
+
+# Deleted rows are compacted away once they are this share of the table
+COMPACT_RATIO = 0.25
+
+_MISSING = object()
+
+
+def _index_key(value):
+    # Firestore equality matches 1 and 1.0 but not True; keep bools apart from numbers
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (int, float)):
+        return ("number", value)
+    if isinstance(value, str):
+        return ("string", value)
+    if value is None:
+        return ("null", None)
+    return None
+
+
+def _order_key(value):
+    # Firestore's cross-type ordering for the values a name can hold
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime.datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class DriverReplica:
+    """
+    Columnar in-process copy of the drivers collection with secondary indexes
+
+    Each field is a column (a list indexed by row), repeated strings are
+    interned, and deleted rows are tombstoned until compaction. Hash indexes
+    on HASH_INDEXED fields answer equality filters, a sorted index answers
+    min_wins, and a (name, id) ordered index answers the default ordering and
+    cursor pagination the way the Firestore query does.
+
+    The replica is fed either by the change feed ("feed": every write
+    arrives within moments) or by the drivers write counter ("versions": a
+    single collection scan whenever the counter moves). If it can't confirm
+    it is within max_staleness seconds of Firestore, available() is False
+    and callers query Firestore instead.
+
+    Args:
+        mode (str): "off", "versions" or "feed"
+        max_staleness (float): Seconds the replica may lag before it is bypassed
+    """
+
+    def __init__(self, mode=REPLICA_MODE, max_staleness=REPLICA_MAX_STALENESS):
+        self.mode = mode
+        self.max_staleness = max_staleness
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._synced_at = None
+        self._version = None   # versions mode: counter value the table reflects
+        self._seq = None       # feed mode: change feed sequence the table reflects
+        self._hits = 0
+        self._fallbacks = 0
+        self._reset()
+
+    def _reset(self):
+        self._ids = []
+        self._rows = {}        # driver id -> row
+        self._columns = {}     # field -> list of values (_MISSING where absent)
+        self._hash = {field: {} for field in HASH_INDEXED}  # field -> key -> set of rows
+        self._range = []       # sorted (race_wins, row) for numeric race_wins
+        self._by_name = []     # sorted (order key of name, id, row)
+        self._deleted = 0
+
+    # Table maintenance (called with the lock held)
+
+    def _insert(self, driver_id, data):
+        row = len(self._ids)
+        self._ids.append(driver_id)
+        self._rows[driver_id] = row
+        for column in self._columns.values():
+            column.append(_MISSING)
+        for field, value in data.items():
+            if isinstance(value, str) and len(value) <= 64:
+                value = sys.intern(value)
+            column = self._columns.get(field)
+            if column is None:
+                column = self._columns[field] = [_MISSING] * (row + 1)
+            column[row] = value
+
+        for field in HASH_INDEXED:
+            key = _index_key(data[field]) if field in data else None
+            if key is not None:
+                self._hash[field].setdefault(key, set()).add(row)
+        if _is_number(data.get(RANGE_INDEXED)):
+            bisect.insort(self._range, (data[RANGE_INDEXED], row))
+        if "name" in data:
+            bisect.insort(self._by_name, (_order_key(data["name"]), driver_id, row))
+
+    def _delete(self, driver_id):
+        row = self._rows.pop(driver_id, None)
+        if row is None:
+            return
+        data = self._row_data(row)
+        for field in HASH_INDEXED:
+            key = _index_key(data[field]) if field in data else None
+            rows = self._hash[field].get(key)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._hash[field][key]
+        if _is_number(data.get(RANGE_INDEXED)):
+            entry = (data[RANGE_INDEXED], row)
+            del self._range[bisect.bisect_left(self._range, entry)]
+        if "name" in data:
+            entry = (_order_key(data["name"]), driver_id, row)
+            del self._by_name[bisect.bisect_left(self._by_name, entry)]
+
+        self._ids[row] = None
+        for column in self._columns.values():
+            column[row] = _MISSING
+        self._deleted += 1
+
+    def _upsert(self, driver_id, data):
+        self._delete(driver_id)
+        self._insert(driver_id, data)
+        if self._deleted > COMPACT_RATIO * len(self._ids) and self._deleted > 64:
+            self._load(self._documents())
+
+    def _load(self, documents):
+        self._reset()
+        for driver_id, data in documents.items():
+            self._insert(driver_id, data)
+
+    def _row_data(self, row, fields=None):
+        if fields is None:
+            return {field: column[row] for field, column in self._columns.items() if column[row] is not _MISSING}
+        data = {}
+        for field in fields:
+            column = self._columns.get(field)
+            if column is not None and column[row] is not _MISSING:
+                data[field] = column[row]
+        return data
+
+    def _documents(self):
+        return {self._ids[row]: self._row_data(row) for row in self._rows.values()}
+
+    # Freshness
+
+    def _sync_feed(self):
+        change_feed.start()
+        if not change_feed.is_live("drivers"):
+            return False
+        with self._lock:
+            events = change_feed.events_after(self._seq) if self._seq is not None else None
+            if events is None:
+                self._seq, documents = change_feed.documents("drivers")
+                self._load(documents)
+            else:
+                for event in events:
+                    if event["collection"] == "drivers":
+                        if event["type"] == "removed":
+                            self._delete(event["id"])
+                        else:
+                            self._upsert(event["id"], event["data"])
+                    self._seq = event["seq"]
+        self._synced_at = time.time()
+        return True
+
+    def _sync_versions(self):
+        if time.time() - collection_versions.read_at > self.max_staleness:
+            collection_versions.invalidate()
+        version = collection_versions.get("drivers")[0]
+        if version != self._version:
+            # One thread reloads; the others use Firestore meanwhile rather than queue up
+            if not self._reload_lock.acquire(blocking=False):
+                return False
+            try:
+                if version != self._version:
+                    with profiler.operation("replica.load", shape="drivers"):
+                        documents = {doc.id: doc.to_dict() for doc in db.collection("drivers").stream()}
+                        profiler.annotate(reads=len(documents))
+                    with self._lock:
+                        self._load(documents)
+                        self._version = version
+            finally:
+                self._reload_lock.release()
+        self._synced_at = collection_versions.read_at
+        return True
+
+    def available(self):
+        """
+        True if reads can be served locally: the replica is on, caught up
+        with every write it knows of, and confirmed in sync with Firestore
+        within the last max_staleness seconds
+        """
+        if self.mode not in ("feed", "versions"):
+            return False
+        try:
+            synced = self._sync_feed() if self.mode == "feed" else self._sync_versions()
+        except Exception as e:
+            logger.warning(f"Driver replica sync failed: {e}")
+            synced = False
+
+        # A moved write counter means the table is known to be out of date; a
+        # stopped listener only means it might be, so the staleness bound applies
+        if self.mode == "versions" and not synced:
+            return self._fallback()
+        if self._synced_at is None or time.time() - self._synced_at > self.max_staleness:
+            return self._fallback()
+        return self._hit()
+
+    def _hit(self):
+        self._hits += 1
+        return True
+
+    def _fallback(self):
+        self._fallbacks += 1
+        return False
+
+    def invalidate(self):
+        """Drop the table; the next read reloads it"""
+        with self._lock:
+            self._reset()
+            self._version = None
+            self._seq = None
+            self._synced_at = None
+
+    # Queries
+
+    def _filter_rows(self, filters):
+        """Rows matching equality filters (field -> value) and min_wins, or None for all rows"""
+        sets = []
+        for field, value in (filters or {}).items():
+            if field == "min_wins":
+                start = bisect.bisect_left(self._range, (value, -1))
+                sets.append({row for _, row in self._range[start:]})
+            elif field in HASH_INDEXED:
+                sets.append(self._hash[field].get(_index_key(value), set()))
+            else:
+                raise ValueError(f"Field {field} is not indexed")
+        if not sets:
+            return None
+        sets.sort(key=len)
+        rows = set(sets[0])
+        for other in sets[1:]:
+            rows &= other
+        return rows
+
+    def page(self, limit=10, start_after=None, filters=None, fields=None):
+        """
+        Drivers ordered by (name, id), like database.get_drivers
+
+        Args:
+            limit (int): Maximum number of drivers
+            start_after (tuple): (name, id) of the last driver of the previous page
+            filters (dict): team_id, min_wins, nationality and/or active
+            fields (list): Fields to return (name is always included)
+
+        Returns:
+            list: Driver dicts, each with an "id"
+        """
+        # Same reading of the filters as the Firestore query: empty values are ignored
+        filters = {key: value for key, value in (filters or {}).items()
+                   if key in PAGE_FILTERS and (key == "active" or value)}
+        if "min_wins" in filters:
+            filters["min_wins"] = int(filters["min_wins"])
+        fields = sorted(set(fields) | {"name"}) if fields else None
+
+        with self._lock:
+            rows = self._filter_rows(filters)
+            if rows is not None and len(rows) * 8 < len(self._by_name):
+                # Few matches: sort just those rather than walk the whole order
+                names = self._columns["name"]
+                order = sorted((_order_key(names[row]), self._ids[row], row)
+                               for row in rows if names[row] is not _MISSING)
+                rows = None
+            else:
+                order = self._by_name
+
+            start = 0
+            if start_after is not None:
+                name, doc_id = start_after
+                start = bisect.bisect_right(order, (_order_key(name), doc_id, sys.maxsize))
+
+            results = []
+            for _, driver_id, row in order[start:]:
+                if rows is not None and row not in rows:
+                    continue
+                results.append({"id": driver_id, **self._row_data(row, fields)})
+                if len(results) >= limit:
+                    break
+        return results
+
+    def all(self, fields=None):
+        """Every driver, in document ID order like an unordered collection scan"""
+        with self._lock:
+            return [{"id": driver_id, **self._row_data(self._rows[driver_id], fields)}
+                    for driver_id in sorted(self._rows)]
+
+    def where(self, field, value):
+        """Drivers whose field equals value, in document ID order"""
+        with self._lock:
+            rows = self._filter_rows({field: value})
+            return [{"id": self._ids[row], **self._row_data(row)}
+                    for row in sorted(rows, key=lambda row: self._ids[row])]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "rows": len(self._rows),
+                "tombstones": self._deleted,
+                "columns": len(self._columns),
+                "age_seconds": round(time.time() - self._synced_at, 1) if self._synced_at else None,
+                "max_staleness": self.max_staleness,
+                "hits": self._hits,
+                "fallbacks": self._fallbacks,
+            }
+
+
+# Shared replica for the process
+driver_replica = DriverReplica()
@@ -1,11 +1,19 @@
 from flask import Blueprint, request, jsonify, session, current_app
-from app.database import get_drivers, add_driver, get_driver, update_driver, delete_driver
+from app.database import (
+    get_drivers, add_driver, get_driver, update_driver, delete_driver,
+    DriverNotFound, NotDriverOwner, DriverWriteConflict
+)
 from app.auth import login_required
+from app.stats import get_stats
+from app.search import driver_index
+from app.teams import team_resolver
+from app.http_cache import conditional
 
 routes_bp = Blueprint("routes_bp", __name__)
 
 @routes_bp.route("/drivers", methods=["GET"])
 @login_required
+@conditional("drivers", "teams")
 def list_drivers():
     try:
         limit = min(int(request.args.get("limit", 10)), 50)
@@ -24,7 +32,11 @@ def list_drivers():
         if "active" in request.args:
             filters["active"] = request.args.get("active").lower() == "true"
         
-        drivers, last_doc = get_drivers(limit, start_after, filters)
+        try:
+            drivers, next_cursor = get_drivers(limit, start_after, filters)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        drivers = team_resolver.attach(drivers)
         
         return jsonify({
             "drivers": drivers,
@@ -32,7 +44,7 @@ def list_drivers():
                 "count": len(drivers),
                 "limit": limit,
                 "has_more": len(drivers) == limit,
-                "next_cursor": last_doc if len(drivers) == limit else None
+                "next_cursor": next_cursor if len(drivers) == limit else None
             },
             "filters": filters
         }), 200
@@ -42,6 +54,7 @@ def list_drivers():
 
 @routes_bp.route("/drivers/<driver_id>", methods=["GET"])
 @login_required
+@conditional("drivers")
 def get_single_driver(driver_id):
     try:
         driver = get_driver(driver_id)
@@ -80,15 +93,21 @@ def update_single_driver(driver_id):
     try:
         data = request.json
         user_id = session.get("user", {}).get("uid", "unknown")
+        is_admin = session.get("user", {}).get("is_admin", False)
         
-        existing_driver = get_driver(driver_id)
-        if not existing_driver:
-            return jsonify({"error": "Driver not found"}), 404
-        
-        update_driver(driver_id, data, user_id)
+        # Existence, ownership and the If-Match version are checked inside the write
+        update_driver(driver_id, data, user_id, owner_id=None if is_admin else user_id,
+                      expected_update_time=request.headers.get("If-Match"))
         current_app.logger.info(f"Driver {driver_id} updated by {user_id}")
         
         return jsonify({"message": "Driver updated successfully", "id": driver_id}), 200
+    except DriverNotFound:
+        return jsonify({"error": "Driver not found"}), 404
+    except NotDriverOwner:
+        current_app.logger.warning(f"User {user_id} attempted to update driver {driver_id} created by another user")
+        return jsonify({"error": "You don't have permission to update this driver"}), 403
+    except DriverWriteConflict as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         current_app.logger.error(f"Error updating driver {driver_id}: {str(e)}")
         return jsonify({"error": f"Failed to update driver: {str(e)}"}), 500
@@ -98,20 +117,20 @@ def update_single_driver(driver_id):
 def delete_single_driver(driver_id):
     try:
         user_id = session.get("user", {}).get("uid", "unknown")
-        existing_driver = get_driver(driver_id)
-        if not existing_driver:
-            return jsonify({"error": "Driver not found"}), 404
-            
-        if existing_driver.get("created_by") and existing_driver["created_by"] != user_id:
-            is_admin = session.get("user", {}).get("is_admin", False)
-            if not is_admin:
-                current_app.logger.warning(f"User {user_id} attempted to delete driver {driver_id} created by {existing_driver['created_by']}")
-                return jsonify({"error": "You don't have permission to delete this driver"}), 403
+        is_admin = session.get("user", {}).get("is_admin", False)
         
-        delete_driver(driver_id)
+        delete_driver(driver_id, owner_id=None if is_admin else user_id,
+                      expected_update_time=request.headers.get("If-Match"))
         current_app.logger.info(f"Driver {driver_id} deleted by {user_id}")
         
         return jsonify({"message": "Driver deleted successfully", "id": driver_id}), 200
+    except DriverNotFound:
+        return jsonify({"error": "Driver not found"}), 404
+    except NotDriverOwner:
+        current_app.logger.warning(f"User {user_id} attempted to delete driver {driver_id} created by another user")
+        return jsonify({"error": "You don't have permission to delete this driver"}), 403
+    except DriverWriteConflict as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         current_app.logger.error(f"Error deleting driver {driver_id}: {str(e)}")
         return jsonify({"error": f"Failed to delete driver: {str(e)}"}), 500
@@ -126,17 +145,19 @@ def search_drivers():
         if not query or len(query) < 2:
             return jsonify({"error": "Search query must be at least 2 characters"}), 400
             
-        drivers, _ = get_drivers(limit=100)
-        filtered_drivers = [
-            driver for driver in drivers 
-            if query in driver.get("name", "").lower() or 
-               query in driver.get("team_name", "").lower() or
-               query in driver.get("nationality", "").lower()
-        ]
-        
-        filtered_drivers = filtered_drivers[:limit]
+        filtered_drivers = driver_index.search(query, limit=limit)
         
         return jsonify({"drivers": filtered_drivers, "count": len(filtered_drivers), "query": query}), 200
     except Exception as e:
         current_app.logger.error(f"Error searching drivers: {str(e)}")
         return jsonify({"error": f"Failed to search drivers: {str(e)}"}), 500
+
+@routes_bp.route("/stats", methods=["GET"])
+@login_required
+@conditional("drivers")
+def driver_stats():
+    try:
+        return jsonify(get_stats()), 200
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving stats: {str(e)}")
+        return jsonify({"error": f"Failed to retrieve stats: {str(e)}"}), 500
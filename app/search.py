@@ -0,0 +1,232 @@
+import re
+import threading
+import time
+
+from firebase_admin import firestore
+
+from app.replica import driver_replica
+from app.teams import team_resolver
+
+db = firestore.client()
+
+# Searchable driver fields and how much a match in each counts towards rank
+SEARCH_FIELDS = {'name': 3.0, 'team_name': 2.0, 'team': 2.0, 'nationality': 1.0}
+
+# Postings hold every 1..NGRAM_SIZE character substring of every word
+NGRAM_SIZE = 3
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _words(text):
+    return WORD_PATTERN.findall(str(text).lower())
+
+
+def _grams(word):
+    grams = set()
+    for size in range(1, min(NGRAM_SIZE, len(word)) + 1):
+        for start in range(len(word) - size + 1):
+            grams.add(word[start:start + size])
+    return grams
+
+
+def _query_grams(word):
+    # Longest grams are the most selective; shorter words are grams themselves
+    size = min(NGRAM_SIZE, len(word))
+    return {word[start:start + size] for start in range(len(word) - size + 1)}
+
+
+class DriverSearchIndex:
+    """
+    In-process n-gram inverted index over driver text fields
+
+    Lookups intersect the posting lists of the query's n-grams, verify the
+    candidates by substring match and rank them by where the query matched
+    (exact word > word prefix > substring, weighted per field). Drivers are
+    indexed with their team_name resolved from team_id. The index is built
+    from one scan of the drivers collection, patched by upsert()/remove() on
+    local writes, and rebuilt after max_age seconds to pick up writes made
+    by other instances. Local writes indexed while a rebuild's scan runs are
+    applied again on top of the new index, so the scan can't undo them.
+
+    Args:
+        max_age (int): Seconds before the index is rebuilt from Firestore
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._docs = {}      # driver id -> driver dict
+        self._postings = {}  # gram -> set of driver ids
+        self._doc_grams = {}  # driver id -> grams it was indexed under
+        self._journal = None  # (driver id, data or None for a removal, merge) while a rebuild scans
+        self._invalidations = 0
+        self._built_at = None
+
+    def _index(self, driver_id, driver):
+        grams = set()
+        for field in SEARCH_FIELDS:
+            for word in _words(driver.get(field) or ''):
+                grams |= _grams(word)
+
+        self._docs[driver_id] = driver
+        self._doc_grams[driver_id] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(driver_id)
+
+    def _unindex(self, driver_id):
+        self._docs.pop(driver_id, None)
+        for gram in self._doc_grams.pop(driver_id, ()):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(driver_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def _apply(self, driver_id, data, merge):
+        existing = self._docs.get(driver_id, {}) if merge else {}
+        self._unindex(driver_id)
+        if data is not None:
+            self._index(driver_id, {**existing, **data, 'id': driver_id})
+
+    def load(self, drivers, replay=()):
+        """
+        Replace the index contents with the given driver dicts (each with an
+        'id'), then apply the replayed (driver id, data, merge) writes
+        """
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._doc_grams = {}
+            for driver in drivers:
+                self._index(driver['id'], driver)
+            for driver_id, data, merge in replay:
+                self._apply(driver_id, data, merge)
+            self._built_at = time.time()
+
+    def _write(self, driver_id, data, merge):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((driver_id, data, merge))
+            if self._built_at is not None:
+                self._apply(driver_id, data, merge)
+
+    def upsert(self, driver_id, data, merge=True):
+        """Index a created or updated driver; with merge, data may be a partial update"""
+        # Server-side sentinels have no value until Firestore resolves them
+        data = {k: v for k, v in data.items() if v is not firestore.SERVER_TIMESTAMP}
+        if 'team_id' in data or 'team' in data:
+            data = team_resolver.attach([data])[0]
+        self._write(driver_id, data, merge)
+
+    def remove(self, driver_id):
+        self._write(driver_id, None, False)
+
+    def invalidate(self):
+        """Rebuild on next use, e.g. after another process wrote to drivers or teams"""
+        with self._lock:
+            self._built_at = None
+            self._invalidations += 1
+
+    def is_stale(self):
+        return self._built_at is None or time.time() - self._built_at > self.max_age
+
+    def ensure_fresh(self):
+        if not self.is_stale():
+            return
+        # One thread rebuilds; the others wait for it rather than scanning too
+        with self._build_lock:
+            if not self.is_stale():
+                return
+            with self._lock:
+                self._journal = []
+                invalidations = self._invalidations
+            try:
+                drivers = _fetch_drivers_for_index()
+                with self._lock:
+                    self.load(drivers, self._journal)
+                    if self._invalidations != invalidations:
+                        # Invalidated mid-scan: the scan may predate that write
+                        self._built_at = None
+            finally:
+                with self._lock:
+                    self._journal = None
+
+    def search(self, query, limit=10, fields=None):
+        """
+        Find drivers whose fields contain every word of the query
+
+        Args:
+            query (str): Free-text query
+            limit (int): Maximum number of results
+            fields (list): Restrict matching to these fields (default: all SEARCH_FIELDS)
+
+        Returns:
+            list: Matching driver dicts, best match first
+        """
+        self.ensure_fresh()
+        words = _words(query)
+        if not words:
+            return []
+        fields = [f for f in (fields or SEARCH_FIELDS) if f in SEARCH_FIELDS]
+
+        with self._lock:
+            candidates = None
+            for word in words:
+                for gram in _query_grams(word):
+                    ids = self._postings.get(gram, set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+                    if not candidates:
+                        return []
+
+            scored = []
+            for driver_id in candidates:
+                driver = self._docs[driver_id]
+                score = self._score(driver, words, fields)
+                if score:
+                    scored.append((score, driver))
+
+        scored.sort(key=lambda item: (-item[0], str(item[1].get('name', ''))))
+        return [driver for _, driver in scored[:limit]]
+
+    @staticmethod
+    def _score(driver, words, fields):
+        total = 0.0
+        for word in words:
+            best = 0.0
+            for field in fields:
+                field_words = _words(driver.get(field) or '')
+                if word in field_words:
+                    match = 3.0
+                elif any(w.startswith(word) for w in field_words):
+                    match = 2.0
+                elif any(word in w for w in field_words):
+                    match = 1.0
+                else:
+                    continue
+                best = max(best, match * SEARCH_FIELDS[field])
+            # Every query word has to match somewhere
+            if not best:
+                return 0.0
+            total += best
+        return total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "grams": len(self._postings),
+                "age_seconds": round(time.time() - self._built_at, 1) if self._built_at else None,
+            }
+
+
+def _fetch_drivers_for_index():
+    # The drivers replica, when on and fresh, saves a collection scan
+    if driver_replica.available():
+        return team_resolver.attach(driver_replica.all())
+    return team_resolver.attach([{"id": doc.id, **doc.to_dict()} for doc in db.collection("drivers").stream()])
+
+
+# Shared index for the process
+driver_index = DriverSearchIndex()
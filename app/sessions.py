@@ -0,0 +1,109 @@
+import logging
+import os
+import tempfile
+import time
+
+import redis
+from cachelib import FileSystemCache
+from flask import current_app, redirect, request, session
+from flask_session import Session
+
+logger = logging.getLogger(__name__)
+
+# Where sessions live: a Redis URL shares them between instances; otherwise a
+# directory of files shared by this instance's workers
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL")
+SESSION_FILE_DIR = os.environ.get("SESSION_FILE_DIR", os.path.join(tempfile.gettempdir(), "f1-datahub-sessions"))
+SESSION_FILE_THRESHOLD = int(os.environ.get("SESSION_FILE_THRESHOLD", 10000))
+
+# Set on App Engine (GAE_ENV) and Cloud Run (K_SERVICE), where requests are
+# spread over several instances with separate disks
+MULTI_INSTANCE = bool(os.environ.get("GAE_ENV") or os.environ.get("K_SERVICE"))
+
+# Signed-in sessions idle for longer than this are cleared
+SESSION_IDLE_TIMEOUT = 7200
+
+# last_activity is only rewritten once it is this many seconds old, so most
+# requests leave the session untouched: no store write and no Set-Cookie
+ACTIVITY_RESOLUTION = 60
+
+# Paths a timed-out user isn't redirected away from
+AUTH_PATHS = ("/auth", "/login", "/register", "/google-login", "/api/auth")
+
+
+def _is_auth_path(path):
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in AUTH_PATHS)
+
+
+def regenerate_session():
+    """
+    Move the session to a fresh ID and drop the stored record under the old
+    one. Call after a successful sign-in, so a session ID planted in the
+    browser beforehand (session fixation) never becomes authenticated.
+    """
+    interface = current_app.session_interface
+    if hasattr(interface, "regenerate") and session:
+        interface.regenerate(session)
+
+
+def end_session():
+    """Sign out: delete the stored session and empty it (the cookie is removed on save)"""
+    regenerate_session()
+    session.clear()
+
+
+def init_sessions(app, idle_timeout=SESSION_IDLE_TIMEOUT, resolution=ACTIVITY_RESOLUTION):
+    """
+    Keep sessions server-side (Flask-Session) and time out idle sign-ins
+
+    The browser only holds a random session ID. Sessions are written back
+    when they change rather than on every request, and the activity
+    timestamp changes at most once per `resolution` seconds, so a signed-in
+    user browsing costs a session write (and a refreshed cookie) about
+    once a minute. Static files don't touch the session at all.
+
+    On App Engine or Cloud Run the session files would be local to one
+    instance, so without SESSION_REDIS_URL sessions stay in Flask's signed
+    cookie there (idle timeouts still apply).
+
+    Args:
+        idle_timeout (int): Seconds of inactivity before a signed-in session is cleared
+        resolution (int): Seconds last_activity may lag behind the latest request
+    """
+    app.config["SESSION_PERMANENT"] = True
+    app.config["SESSION_REFRESH_EACH_REQUEST"] = False
+    if SESSION_REDIS_URL:
+        app.config["SESSION_TYPE"] = "redis"
+        app.config["SESSION_REDIS"] = redis.Redis.from_url(SESSION_REDIS_URL)
+        Session(app)
+    elif MULTI_INSTANCE:
+        logger.error("SESSION_REDIS_URL is not set: keeping sessions in signed cookies, as "
+                     "session files would be lost whenever a request reaches another instance")
+    else:
+        app.config["SESSION_TYPE"] = "cachelib"
+        app.config["SESSION_CACHELIB"] = FileSystemCache(SESSION_FILE_DIR, threshold=SESSION_FILE_THRESHOLD)
+        Session(app)
+
+    @app.before_request
+    def track_activity():
+        if request.endpoint == "static" or request.path.startswith(app.static_url_path + "/"):
+            return
+        if "user" not in session:
+            return
+
+        now = time.time()
+        try:
+            last_active = float(session.get("last_activity"))
+        except (TypeError, ValueError):
+            last_active = None
+
+        if last_active is not None and now - last_active > idle_timeout:
+            session.clear()
+            if not _is_auth_path(request.path):
+                return redirect("/auth")
+            return
+
+        if last_active is None or now - last_active >= resolution:
+            session["last_activity"] = now
+
+    return track_activity
@@ -0,0 +1,88 @@
+import threading
+from functools import wraps
+
+from app.cache import make_key
+
+
+class _Call:
+    """An in-flight call whose result is shared with any callers that join it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical calls into one execution
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is still running block and receive the same result (or
+    exception) instead of issuing their own Firestore read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "in_flight": len(self._calls),
+            }
+
+
+# Shared by every Firestore read path in the process
+single_flight = SingleFlight()
+
+
+def coalesce(key_prefix=''):
+    """Route calls of a read function through the shared single-flight group"""
+    def decorator(f):
+        prefix = key_prefix or f"{f.__module__}.{f.__qualname__}"
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return single_flight.do(make_key(prefix, args, kwargs), f, *args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,126 @@
+from firebase_admin import firestore
+
+db = firestore.client()
+
+# Materialized driver statistics, kept current by every driver write
+STATS_COLLECTION = "stats"
+STATS_DOCUMENT = "drivers"
+
+# Page size for rebuild scans; only three small fields are projected per driver
+REBUILD_PAGE_SIZE = 1000
+
+
+def stats_ref():
+    return db.collection(STATS_COLLECTION).document(STATS_DOCUMENT)
+
+
+def _contribution(driver):
+    """What one driver document adds to the stats document"""
+    if not driver:
+        return {}
+
+    wins = driver.get('race_wins', 0)
+    counts = {
+        'total_drivers': 1,
+        'total_wins': wins if isinstance(wins, (int, float)) else 0,
+    }
+    if driver.get('team_id'):
+        counts[('drivers_by_team', driver['team_id'])] = 1
+    if driver.get('nationality'):
+        counts[('drivers_by_nationality', driver['nationality'])] = 1
+    return counts
+
+
+def stats_delta(old, new):
+    """
+    Field changes that turn the stats for `old` into the stats for `new`
+
+    Either side may be None (driver created or deleted). Keys are field names
+    or (map, key) pairs for the per-team and per-nationality counts.
+    """
+    delta = dict(_contribution(new))
+    for key, value in _contribution(old).items():
+        delta[key] = delta.get(key, 0) - value
+    return {key: value for key, value in delta.items() if value}
+
+
+def apply_stats_delta(writer, old, new):
+    """
+    Queue increments on the stats document in a write batch or transaction
+
+    Args:
+        writer: A WriteBatch or Transaction the driver write is part of
+        old (dict): Driver data before the write (None when creating)
+        new (dict): Driver data after the write (None when deleting)
+    """
+    delta = stats_delta(old, new)
+    if not delta:
+        return
+
+    update = {'updated_at': firestore.SERVER_TIMESTAMP}
+    for key, value in delta.items():
+        if isinstance(key, tuple):
+            group, name = key
+            update.setdefault(group, {})[name] = firestore.Increment(value)
+        else:
+            update[key] = firestore.Increment(value)
+
+    # merge=True merges the count maps. If the document doesn't exist yet this
+    # creates it holding only this delta, without the initialized marker, so
+    # the next get_stats() rebuilds it from the collection
+    writer.set(stats_ref(), update, merge=True)
+
+
+def get_stats():
+    """Read the materialized stats, building them on first use"""
+    doc = stats_ref().get()
+    data = doc.to_dict() if doc.exists else None
+    if not data or not data.get('initialized'):
+        return rebuild_stats()
+
+    stats = {
+        'total_drivers': data.get('total_drivers', 0),
+        'total_wins': data.get('total_wins', 0),
+    }
+    # Counts that dropped back to zero stay in the maps; hide them
+    for group in ('drivers_by_team', 'drivers_by_nationality'):
+        stats[group] = {key: count for key, count in data.get(group, {}).items() if count}
+    return stats
+
+
+def rebuild_stats(page_size=REBUILD_PAGE_SIZE):
+    """
+    Recompute the stats document from the drivers collection
+
+    Writes racing the scan can be lost from the result, so run it when the
+    counters are suspected to have drifted, not on a schedule under load.
+    """
+    query = (
+        db.collection("drivers")
+        .select(['race_wins', 'team_id', 'nationality'])
+        .order_by('__name__')
+        .limit(page_size)
+    )
+
+    totals = {}
+    page = list(query.stream())
+    while page:
+        for doc in page:
+            for key, value in _contribution(doc.to_dict()).items():
+                totals[key] = totals.get(key, 0) + value
+        if len(page) < page_size:
+            break
+        page = list(query.start_after(page[-1]).stream())
+
+    stats = {
+        'total_drivers': totals.pop('total_drivers', 0),
+        'total_wins': totals.pop('total_wins', 0),
+        'drivers_by_team': {},
+        'drivers_by_nationality': {},
+    }
+    for (group, name), count in totals.items():
+        stats[group][name] = count
+
+    # Only a full rebuild marks the document as holding complete totals
+    stats_ref().set({**stats, 'initialized': True, 'updated_at': firestore.SERVER_TIMESTAMP})
+    return stats
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from firebase_admin import firestore
+
+from app.db_utils import batch_get
+
+db = firestore.client()
+
+
+class TeamResolver:
+    """
+    Warm in-memory map of team ID -> team name
+
+    Team IDs not in the map (or older than max_age seconds) are fetched
+    together with a single get_all, so resolving the teams of a whole page of
+    drivers costs at most one round trip and usually none. Teams are few and
+    rarely change, so the map stays small; local team writes update it
+    through remember()/forget().
+
+    Args:
+        max_age (int): Seconds a resolved name is trusted before re-reading it
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._names = {}  # team id -> (name, loaded at)
+
+    def resolve(self, team_ids):
+        """
+        Look up team names, reading only unknown or stale teams from Firestore
+
+        Returns:
+            dict: team id -> team name, or None if the team doesn't exist
+        """
+        team_ids = {team_id for team_id in team_ids if team_id}
+        now = time.time()
+        resolved, missing = {}, []
+        with self._lock:
+            for team_id in team_ids:
+                entry = self._names.get(team_id)
+                if entry and now - entry[1] <= self.max_age:
+                    resolved[team_id] = entry[0]
+                else:
+                    missing.append(team_id)
+
+        if missing:
+            teams = batch_get([db.collection('teams').document(team_id) for team_id in missing])
+            with self._lock:
+                for team_id in missing:
+                    team = teams.get(team_id)
+                    if team is None:
+                        # Not cached, so a team created elsewhere is found next time
+                        self._names.pop(team_id, None)
+                        resolved[team_id] = None
+                    else:
+                        resolved[team_id] = team.get('name', '')
+                        self._names[team_id] = (resolved[team_id], now)
+        return resolved
+
+    def attach(self, drivers):
+        """
+        Return copies of the drivers with a 'team_name' resolved from team_id
+
+        Drivers without a resolvable team_id fall back to their stored 'team'.
+        """
+        names = self.resolve(driver.get('team_id') for driver in drivers)
+        return [
+            {**driver, 'team_name': names.get(driver.get('team_id')) or driver.get('team') or ''}
+            if 'team_id' in driver or 'team' in driver else driver
+            for driver in drivers
+        ]
+
+    def remember(self, team_id, name):
+        with self._lock:
+            self._names[team_id] = (name, time.time())
+
+    def forget(self, team_id=None):
+        with self._lock:
+            if team_id is None:
+                self._names.clear()
+            else:
+                self._names.pop(team_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"teams": len(self._names)}
+
+
+# Shared resolver for the process
+team_resolver = TeamResolver()
@@ -0,0 +1,66 @@
+import hashlib
+import time
+
+from firebase_admin import auth as firebase_auth
+
+from app.cache import LRUCache
+
+# Cached tokens are dropped this many seconds before their own exp claim
+EXPIRY_MARGIN = 5
+
+
+class VerifiedTokenCache:
+    """
+    Cache of decoded Firebase ID tokens so repeat API calls skip verification
+
+    Entries are keyed by a SHA-256 of the token (raw tokens are never kept as
+    keys), bounded in number, and expire at the token's own exp claim.
+    Revocation hooks run on every cache hit; any hook returning True evicts
+    the token and fails the request as revoked. revoke_uid() evicts every
+    cached token of a user, e.g. after revoking their refresh tokens.
+
+    Args:
+        max_entries (int): Maximum number of cached tokens
+    """
+
+    def __init__(self, max_entries=4096):
+        self._cache = LRUCache(max_entries=max_entries, default_timeout=0, stripes=8)
+        self._revocation_hooks = []
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+    def add_revocation_hook(self, hook):
+        """Register hook(claims) -> bool, consulted before serving a cached token"""
+        self._revocation_hooks.append(hook)
+        return hook
+
+    def verify(self, id_token):
+        """
+        Return the token's decoded claims, verifying it only on a cache miss
+
+        Raises:
+            The same firebase_admin.auth errors as verify_id_token()
+        """
+        key = self._key(id_token)
+        claims = self._cache.get(key)
+        if claims is not None:
+            if any(hook(claims) for hook in self._revocation_hooks):
+                self._cache.delete(key)
+                raise firebase_auth.RevokedIdTokenError("The Firebase ID token has been revoked.")
+            return claims
+
+        claims = firebase_auth.verify_id_token(id_token)
+        ttl = claims.get('exp', 0) - time.time() - EXPIRY_MARGIN
+        if ttl > 0:
+            self._cache.set(key, claims, timeout=ttl, tags=[f"uid:{claims.get('uid')}"])
+        return claims
+
+    def revoke_uid(self, uid):
+        """Forget every cached token belonging to a user"""
+        return self._cache.invalidate_tags(f"uid:{uid}")
+
+    def stats(self):
+        stats = self._cache.stats()
+        return {key: stats[key] for key in ('entries', 'hits', 'misses', 'evictions', 'expirations', 'hit_ratio')}
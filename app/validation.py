@@ -0,0 +1,72 @@
+# Validation shared by the web forms and the bulk import tool
+
+DRIVER_INT_FIELDS = ['age', 'race_wins', 'pole_positions', 'fastest_laps', 'world_titles']
+TEAM_INT_FIELDS = ['year_founded', 'race_wins', 'pole_positions', 'constructor_titles', 'finishing_position']
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def _parse_ints(data, fields):
+    values = {}
+    for field in fields:
+        if data.get(field) in (None, ''):
+            raise ValueError(f"Missing required field: {field}")
+        try:
+            values[field] = int(data[field])
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a whole number")
+    return values
+
+def validate_driver(data):
+    """
+    Validate and coerce a driver record (same rules as the add driver form)
+
+    Args:
+        data (dict): Raw field values, e.g. request.form or a CSV row
+
+    Returns:
+        dict: Driver fields ready to store (team is the name as given; the
+            caller resolves team_id to a team name)
+
+    Raises:
+        ValueError: With a user-facing message if the record is invalid
+    """
+    ints = _parse_ints(data, DRIVER_INT_FIELDS)
+    name = (data.get('name') or '').strip()
+    team = (data.get('team') or '').strip()
+    team_id = (data.get('team_id') or '').strip()
+
+    if not name:
+        raise ValueError("Driver name is required")
+    if not team and not team_id:
+        raise ValueError("Team information is required")
+    if ints['age'] < 18 or ints['age'] > 50:
+        raise ValueError("Age must be between 18 and 50")
+    if any(ints[field] < 0 for field in DRIVER_INT_FIELDS if field != 'age'):
+        raise ValueError("Values cannot be negative")
+
+    driver = {"name": name, "team": team, **ints}
+    if team_id:
+        driver['team_id'] = team_id
+
+    # Optional fields the forms don't collect but imports may carry
+    if data.get('nationality'):
+        driver['nationality'] = str(data['nationality']).strip()
+    if data.get('active') not in (None, ''):
+        driver['active'] = _parse_bool(data['active'])
+    return driver
+
+def validate_team(data):
+    """
+    Validate and coerce a team record (same rules as the add team form)
+
+    Raises:
+        ValueError: With a user-facing message if the record is invalid
+    """
+    ints = _parse_ints(data, TEAM_INT_FIELDS)
+    name = (data.get('name') or '').strip()
+    if not name:
+        raise ValueError("Team name is required")
+    return {"name": name, **ints}
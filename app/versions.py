@@ -0,0 +1,179 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from firebase_admin import firestore
+
+db = firestore.client()
+
+# One document holding a write counter per collection: {"drivers": 12, "teams": 3}
+VERSIONS_COLLECTION = "meta"
+VERSIONS_DOCUMENT = "versions"
+
+# Seconds a process trusts its copy of the counters before re-reading them
+VERSIONS_TTL = 2.0
+
+
+def versions_ref():
+    return db.collection(VERSIONS_COLLECTION).document(VERSIONS_DOCUMENT)
+
+
+def bump_version(writer, *collections):
+    """
+    Queue a version increment for collections in the batch or transaction
+    that writes to them, so the counter moves exactly when the data does
+    """
+    writer.set(versions_ref(), {collection: firestore.Increment(1) for collection in collections}, merge=True)
+
+
+class CollectionVersions:
+    """
+    Process-local view of the collection write counters
+
+    The counters are read at most once per ttl seconds (and right after a
+    local write), so conditional requests usually cost no Firestore read.
+    Listeners are told which collections were written by someone else
+    (another worker, instance or tool) since the previous read, which lets
+    in-process caches drop what they can no longer trust. Bumps made by this
+    process's own writes (wrapped in local_write()) are recognised and not
+    reported: the writer already evicted exactly what it changed.
+
+    Listeners run before the new counters are published, so a new ETag is
+    never served alongside a body cached under the old one.
+
+    Args:
+        ttl (float): Seconds a read of the counters is reused
+    """
+
+    def __init__(self, ttl=VERSIONS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._versions = None
+        self._read_at = 0.0
+        self._generation = 0
+        self._listeners = []
+        # Local bumps per collection: writes in progress, committed writes not
+        # yet seen in a read, and bumps seen while their write was in progress
+        self._in_flight = {}
+        self._pending = {}
+        self._credit = {}
+
+    def add_listener(self, listener):
+        """Register listener(changed_collections), called when other processes move counters"""
+        self._listeners.append(listener)
+        return listener
+
+    @property
+    def read_at(self):
+        """When the counters were last read (0 if never, or since invalidate())"""
+        return self._read_at
+
+    def invalidate(self):
+        """Force a re-read on next use"""
+        with self._lock:
+            self._generation += 1
+            self._read_at = 0.0
+
+    @contextmanager
+    def local_write(self, *collections):
+        """
+        Wrap a write that bumps the collections' counters (bump_version)
+
+        The bump is then known to be this process's own and isn't reported
+        to listeners, and the counters are re-read on next use.
+        """
+        with self._lock:
+            for collection in collections:
+                self._in_flight[collection] = self._in_flight.get(collection, 0) + 1
+        committed = False
+        try:
+            yield
+            committed = True
+        finally:
+            unaccounted = set()
+            with self._lock:
+                for collection in collections:
+                    self._in_flight[collection] -= 1
+                    credit = self._credit.get(collection, 0)
+                    if committed and credit:
+                        # A read already saw this write's bump
+                        credit -= 1
+                    elif committed:
+                        self._pending[collection] = self._pending.get(collection, 0) + 1
+                    if credit > self._in_flight[collection]:
+                        # Bumps put down to writes that then failed came from elsewhere
+                        unaccounted.add(collection)
+                        credit = self._in_flight[collection]
+                    self._credit[collection] = credit
+                self._generation += 1
+                self._read_at = 0.0
+            if unaccounted:
+                self._notify(unaccounted)
+
+    def get(self, *collections):
+        """Current counters for the collections, as a tuple in the given order"""
+        with self._lock:
+            fresh = self._versions is not None and time.time() - self._read_at < self.ttl
+            versions = self._versions
+        if not fresh:
+            versions = self._refresh()
+        return tuple(versions.get(collection, 0) for collection in collections)
+
+    def _foreign_changes(self, previous, versions):
+        # Called with the lock held: collections whose counters moved by more
+        # than this process's own writes account for
+        changed = set()
+        for collection in set(previous) | set(versions):
+            moved = versions.get(collection, 0) - previous.get(collection, 0)
+            if not moved:
+                continue
+            if moved < 0:
+                changed.add(collection)
+                continue
+            own = min(moved, self._pending.get(collection, 0))
+            self._pending[collection] = self._pending.get(collection, 0) - own
+            moved -= own
+            credit = self._credit.get(collection, 0)
+            own = min(moved, self._in_flight.get(collection, 0) - credit)
+            self._credit[collection] = credit + own
+            if moved - own:
+                changed.add(collection)
+        return changed
+
+    def _notify(self, changed):
+        for listener in self._listeners:
+            listener(changed)
+
+    def _refresh(self):
+        with self._refresh_lock:
+            with self._lock:
+                # Another thread may have refreshed while this one waited
+                if self._versions is not None and time.time() - self._read_at < self.ttl:
+                    return self._versions
+                generation = self._generation
+
+            read_at = time.time()
+            snapshot = versions_ref().get()
+            versions = snapshot.to_dict() if snapshot.exists else {}
+
+            with self._lock:
+                if self._versions is None:
+                    # First read: every local write so far is included or in progress
+                    changed = set()
+                    self._pending = {}
+                    self._credit = dict(self._in_flight)
+                else:
+                    changed = self._foreign_changes(self._versions, versions)
+            if changed:
+                self._notify(changed)
+
+            with self._lock:
+                self._versions = versions
+                # A write committed during the read may not be in it; read again next time
+                self._read_at = read_at if generation == self._generation else 0.0
+        return versions
+
+
+# Shared counters for the process
+collection_versions = CollectionVersions()
@@ -0,0 +1,106 @@
+"""
+Benchmark app.database.get_driver_stats against the previous implementation
+
+Seeds the in-memory Firestore stand-in with N drivers and reports RPC
+count and wall time for the old 10-documents-per-page loop, the new
+one-pass projected scan, and the aggregation-only totals path.
+
+    python benchmarks/bench_driver_stats.py --drivers 100 1000 5000 --latency 0.005
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_firestore import FakeFirestore, install  # noqa: E402
+
+db = install(FakeFirestore())
+
+from flask import Flask  # noqa: E402
+from app import database  # noqa: E402
+
+
+def legacy_get_driver_stats():
+    """The pre-aggregation implementation, kept here for comparison"""
+    batch_size = 10
+    drivers_ref = db.collection("drivers").limit(batch_size)
+
+    total_drivers = 0
+    total_wins = 0
+    drivers_by_team = {}
+
+    batch = list(drivers_ref.stream())
+    while batch:
+        for doc in batch:
+            data = doc.to_dict()
+            total_drivers += 1
+            total_wins += data.get('race_wins', 0)
+            team_id = data.get('team_id')
+            if team_id:
+                drivers_by_team[team_id] = drivers_by_team.get(team_id, 0) + 1
+        batch = list(drivers_ref.start_after(batch[-1]).stream())
+
+    return {'total_drivers': total_drivers, 'total_wins': total_wins, 'drivers_by_team': drivers_by_team}
+
+
+SCENARIOS = {
+    "legacy_scan": legacy_get_driver_stats,
+    "projected_scan": lambda: database.get_driver_stats(include_breakdown=True),
+    "aggregation_totals": lambda: database.get_driver_stats(include_breakdown=False),
+}
+
+
+def run(drivers, latency):
+    db._collections.clear()
+    db.seed(drivers=drivers, teams=10)
+    db.latency = latency
+
+    results = []
+    expected = None
+    for name, scenario in SCENARIOS.items():
+        db.reset_counters()
+        start = time.perf_counter()
+        stats = scenario()
+        elapsed = time.perf_counter() - start
+
+        if expected is None:
+            expected = stats
+        assert stats['total_drivers'] == expected['total_drivers']
+        assert stats['total_wins'] == expected['total_wins']
+
+        results.append({
+            "scenario": name,
+            "drivers": drivers,
+            "rpcs": sum(db.rpcs.values()),
+            "wall_ms": round(elapsed * 1000, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drivers", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated seconds per RPC")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    results = []
+    with app.app_context():
+        for drivers in args.drivers:
+            results.extend(run(drivers, args.latency))
+
+    print(f"{'scenario':<20}{'drivers':>10}{'rpcs':>8}{'wall_ms':>12}")
+    for row in results:
+        print(f"{row['scenario']:<20}{row['drivers']:>10}{row['rpcs']:>8}{row['wall_ms']:>12}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"latency": args.latency, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
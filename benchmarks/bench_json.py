@@ -0,0 +1,99 @@
+"""
+Benchmark JSON encoding of the driver list
+
+Builds N driver dicts shaped like fetch_all_drivers() output, with Firestore
+timestamps in created_at/updated_at, and reports encode time and body size
+for Flask's default provider, the msgspec provider and the streamed array
+encoder.
+
+    python benchmarks/bench_json.py --drivers 1000 10000 50000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_firestore import FakeFirestore, install  # noqa: E402
+
+install(FakeFirestore())
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds  # noqa: E402
+
+from app.json_provider import MsgspecJSONProvider, iter_json_array  # noqa: E402
+
+
+def make_drivers(count):
+    stamp = DatetimeWithNanoseconds(2024, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    return [{
+        "id": f"driver{i:06d}",
+        "name": f"Driver {i:05d}",
+        "age": 18 + i % 28,
+        "team_id": f"team{i % 10:04d}",
+        "team_name": f"Team {i % 10}",
+        "race_wins": i % 50,
+        "pole_positions": i % 30,
+        "fastest_laps": i % 20,
+        "world_titles": i % 3,
+        "created_by": "user",
+        "created_at": stamp,
+        "updated_at": stamp,
+    } for i in range(count)]
+
+
+def run(app, drivers, repeat):
+    default = DefaultJSONProvider(app)
+    fast = MsgspecJSONProvider(app)
+    scenarios = {
+        "flask_default": lambda: default.dumps(drivers).encode("utf-8"),
+        "msgspec": lambda: fast.response(drivers).get_data(),
+        "msgspec_streamed": lambda: b"".join(iter_json_array(drivers)),
+    }
+
+    results = []
+    for name, scenario in scenarios.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = scenario()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert len(json.loads(body)) == len(drivers)
+        results.append({
+            "scenario": name,
+            "drivers": len(drivers),
+            "bytes": len(body),
+            "encode_ms": round(best * 1000, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drivers", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario; the best is reported")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    results = []
+    with app.app_context():
+        for count in args.drivers:
+            results.extend(run(app, make_drivers(count), args.repeat))
+
+    print(f"{'scenario':<20}{'drivers':>10}{'bytes':>12}{'encode_ms':>12}")
+    for row in results:
+        print(f"{row['scenario']:<20}{row['drivers']:>10}{row['bytes']:>12}{row['encode_ms']:>12}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
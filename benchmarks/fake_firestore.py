@@ -0,0 +1,630 @@
+"""
+In-memory stand-in for the Firestore client used by the app
+
+Implements the subset of the google-cloud-firestore API the app calls
+(collections, queries with where/order_by/select/limit/start_after,
+aggregation queries, document get/set/update/delete, get_all, write
+batches and collection on_snapshot listeners) and counts every simulated RPC so benchmarks can report round
+trips as well as wall time. An optional per-RPC latency makes round trips
+cost something, like they do against the real service.
+"""
+import copy
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1.transforms import DELETE_FIELD, SERVER_TIMESTAMP, Increment
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+TEAM_NAMES = ["Red Bull", "Ferrari", "Mercedes", "McLaren", "Aston Martin",
+              "Alpine", "Williams", "RB", "Sauber", "Haas"]
+NATIONALITIES = ["British", "Dutch", "Spanish", "Monegasque", "Mexican",
+                 "Australian", "German", "French", "Finnish", "Japanese"]
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _set_field(data, key, value):
+    """Assign one field, applying Firestore transforms and sentinels"""
+    if value is DELETE_FIELD:
+        data.pop(key, None)
+    elif isinstance(value, Increment):
+        data[key] = data.get(key, 0) + value.value
+    elif value is SERVER_TIMESTAMP:
+        data[key] = _now()
+    else:
+        data[key] = copy.deepcopy(value)
+
+
+def _merge_field(data, key, value):
+    """set(merge=True) semantics: nested maps are merged rather than replaced"""
+    if isinstance(value, dict):
+        target = data.get(key)
+        if not isinstance(target, dict):
+            target = data[key] = {}
+        for nested_key, nested_value in value.items():
+            _merge_field(target, nested_key, nested_value)
+    else:
+        _set_field(data, key, value)
+
+
+def _set_path(data, path, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        data = data.setdefault(key, {})
+    _set_field(data, keys[-1], value)
+
+
+def _get_path(data, path):
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def _sort_key(value):
+    # Firestore orders values by type first; this is close enough for tests
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    return (4, str(value))
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, fields=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self._fields = fields
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = _now()
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        data = copy.deepcopy(self._data)
+        if self._fields is not None:
+            data = {k: v for k, v in data.items() if k in self._fields}
+        return data
+
+    def get(self, field_path):
+        return _get_path(self._data or {}, field_path)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, transaction=None, **kwargs):
+        self._client._rpc("get")
+        snapshot = self._client._snapshot(self)
+        if transaction is not None:
+            transaction._record_read(snapshot)
+        return snapshot
+
+    def set(self, data, merge=False):
+        self._client._rpc("write")
+        self._client._write(self, "set", data, merge=merge)
+
+    def create(self, data):
+        self._client._rpc("write")
+        self._client._write(self, "create", data)
+
+    def update(self, data, option=None):
+        self._client._rpc("write")
+        self._client._write(self, "update", data, option=option)
+
+    def delete(self, option=None):
+        self._client._rpc("write")
+        self._client._write(self, "delete", None, option=option)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field, alias):
+        self._aggregations.append((kind, field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        return self._add("count", None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add("sum", field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add("avg", field_ref, alias)
+
+    def get(self, transaction=None, **kwargs):
+        client = self._query._client
+        client._rpc("aggregate")
+        rows = [data for _, data, _ in self._query._matching()]
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == "count":
+                value = len(rows)
+            else:
+                values = [_get_path(row, field) for row in rows]
+                values = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == "sum":
+                    value = sum(values)
+                else:
+                    value = sum(values) / len(values) if values else None
+            results.append(FakeAggregationResult(alias, value))
+        return [results]
+
+
+class FakeQuery:
+    def __init__(self, client, collection, filters=(), orders=(), fields=None,
+                 limit=None, cursor=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._fields = fields
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, fields=self._fields,
+                     limit=self._limit, cursor=self._cursor)
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def select(self, field_paths):
+        return self._copy(fields=frozenset(field_paths))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).sum(field_ref, alias)
+
+    def on_snapshot(self, callback):
+        return FakeWatch(self._client, self._collection, callback)
+
+    def _order_values(self, doc_id, data):
+        values = []
+        for field, _ in self._orders:
+            values.append(doc_id if field == "__name__" else _get_path(data, field))
+        return values
+
+    def _cursor_values(self):
+        cursor = self._cursor
+        if isinstance(cursor, FakeDocumentSnapshot):
+            return self._order_values(cursor.id, cursor._data or {}) + [cursor.id]
+        if isinstance(cursor, dict):
+            values = []
+            for field, _ in self._orders:
+                value = cursor.get(field)
+                values.append(value.id if isinstance(value, FakeDocumentReference) else value)
+            return values
+        return list(cursor)
+
+    def _matches(self, data):
+        for field, op, expected in self._filters:
+            value = _get_path(data, field)
+            if op == "==" and value != expected:
+                return False
+            if op == "!=" and value == expected:
+                return False
+            if op in (">", ">=", "<", "<=") and (value is None or isinstance(value, str) != isinstance(expected, str)):
+                return False
+            if op == ">" and not value > expected:
+                return False
+            if op == ">=" and not value >= expected:
+                return False
+            if op == "<" and not value < expected:
+                return False
+            if op == "<=" and not value <= expected:
+                return False
+            if op == "in" and value not in expected:
+                return False
+            if op == "array_contains" and expected not in (value or []):
+                return False
+        return True
+
+    def _matching(self):
+        def key(doc_id, data):
+            parts = [_sort_key(doc_id if field == "__name__" else _get_path(data, field))
+                     for field, _ in self._orders]
+            parts.append(_sort_key(doc_id))
+            return parts
+
+        with self._client._lock:
+            rows = []
+            for doc_id, doc in self._client._collections.get(self._collection, {}).items():
+                data = doc["data"]
+                if not self._matches(data):
+                    continue
+                # Firestore drops documents missing an order_by field
+                if any(field != "__name__" and _get_path(data, field) is None for field, _ in self._orders):
+                    continue
+                rows.append((key(doc_id, data), doc_id, doc))
+
+            descending = any(direction == "DESCENDING" for _, direction in self._orders[:1])
+            rows.sort(key=lambda row: row[0], reverse=descending)
+
+            if self._cursor is not None:
+                cursor = [_sort_key(v) for v in self._cursor_values()]
+                width = len(cursor)
+                if descending:
+                    rows = [row for row in rows if row[0][:width] < cursor]
+                else:
+                    rows = [row for row in rows if row[0][:width] > cursor]
+
+            if self._limit is not None:
+                rows = rows[:self._limit]
+            # Only the returned documents are copied
+            return [(doc_id, copy.deepcopy(doc["data"]), doc) for _, doc_id, doc in rows]
+
+    def stream(self, transaction=None, **kwargs):
+        self._client._rpc("query")
+        for doc_id, data, doc in self._matching():
+            reference = FakeDocumentReference(self._client, self._collection, doc_id)
+            yield FakeDocumentSnapshot(reference, data, doc["create_time"], doc["update_time"],
+                                       fields=self._fields)
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream(transaction=transaction))
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = self._client._new_id()
+        return FakeDocumentReference(self._client, self._collection, document_id)
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return _now(), reference
+
+    def list_documents(self):
+        with self._client._lock:
+            ids = list(self._client._collections.get(self._collection, {}))
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class FakeWatch:
+    """
+    Collection listener: delivers the current documents, then one callback
+    per write, from a background thread like the real Watch
+
+    Callbacks after the first pass an empty document list; the app only
+    reads the full result set on the first delivery.
+    """
+
+    def __init__(self, client, collection, callback):
+        self._client = client
+        self._collection = collection
+        self._callback = callback
+        self._queue = queue.Queue()
+        self.is_active = True
+        with client._lock:
+            client._rpc("listen")
+            docs = [client._snapshot(FakeDocumentReference(client, collection, doc_id))
+                    for doc_id in client._collections.get(collection, {})]
+            client._watches.append(self)
+        self._queue.put((docs, [DocumentChange(ChangeType.ADDED, doc, -1, i) for i, doc in enumerate(docs)]))
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _push(self, change):
+        self._queue.put(([], [change]))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            docs, changes = item
+            self._callback(docs, changes, _now())
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self._client._lock:
+            if self in self._client._watches:
+                self._client._watches.remove(self)
+        self._queue.put(None)
+
+    close = unsubscribe
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append((reference, "set", document_data, {"merge": merge}))
+
+    def create(self, reference, document_data):
+        self._writes.append((reference, "create", document_data, {}))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append((reference, "update", field_updates, {"option": option}))
+
+    def delete(self, reference, option=None):
+        self._writes.append((reference, "delete", None, {"option": option}))
+
+    def commit(self, **kwargs):
+        self._client._rpc("commit")
+        with self._client._lock:
+            for reference, kind, data, options in self._writes:
+                self._client._write(reference, kind, data, **options)
+        results = self._writes
+        self._writes = []
+        return results
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Optimistic transaction compatible with firestore.transactional
+
+    Reads record the document's update time; the commit aborts (and the
+    decorator retries) if any of them changed in between.
+    """
+
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._reads = {}
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = self._client._new_id()
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _record_read(self, snapshot):
+        self._reads.setdefault(snapshot.reference.path, snapshot.update_time)
+
+    def _commit(self):
+        self._client._rpc("commit")
+        with self._client._lock:
+            for path, update_time in self._reads.items():
+                collection, doc_id = path.split("/", 1)
+                doc = self._client._collections.get(collection, {}).get(doc_id)
+                if (doc["update_time"] if doc else None) != update_time:
+                    raise Aborted(f"Transaction contention on {path}")
+            for reference, kind, data, options in self._writes:
+                self._client._write(reference, kind, data, **options)
+        results = self._writes
+        self._clean_up()
+        return results
+
+    def commit(self, **kwargs):
+        return self._commit()
+
+
+class FakeFirestore:
+    """
+    In-memory Firestore client
+
+    Args:
+        latency (float): Seconds slept per simulated RPC
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rpcs = Counter()
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._watches = []
+
+    # Internals shared by references, queries and batches
+
+    def _rpc(self, kind):
+        with self._lock:
+            self.rpcs[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _new_id(self):
+        return f"doc{next(self._ids):08d}"
+
+    def _snapshot(self, reference):
+        with self._lock:
+            doc = self._collections.get(reference._collection, {}).get(reference.id)
+            if doc is None:
+                return FakeDocumentSnapshot(reference, None)
+            return FakeDocumentSnapshot(reference, copy.deepcopy(doc["data"]),
+                                        doc["create_time"], doc["update_time"])
+
+    def _write(self, reference, kind, data, merge=False, option=None):
+        with self._lock:
+            docs = self._collections.setdefault(reference._collection, {})
+            doc = docs.get(reference.id)
+            existed = doc is not None
+            if option is not None:
+                self._check_option(doc, option)
+
+            now = _now()
+            if kind == "delete":
+                if docs.pop(reference.id, None) is not None:
+                    self._notify(reference, ChangeType.REMOVED)
+                return
+            if kind == "create" and doc is not None:
+                raise AlreadyExists(f"Document already exists: {reference.path}")
+            if kind == "update" and doc is None:
+                raise NotFound(f"No document to update: {reference.path}")
+
+            if doc is None or (kind == "set" and not merge):
+                doc = {"data": {}, "create_time": doc["create_time"] if doc else now}
+            for path, value in data.items():
+                # update() takes dotted field paths, set() takes literal keys
+                if kind == "update":
+                    _set_path(doc["data"], path, value)
+                elif merge:
+                    _merge_field(doc["data"], path, value)
+                else:
+                    _set_field(doc["data"], path, value)
+            doc["update_time"] = now
+            docs[reference.id] = doc
+            self._notify(reference, ChangeType.MODIFIED if existed else ChangeType.ADDED)
+
+    def _notify(self, reference, change_type):
+        # Called with the lock held, right after the write
+        watches = [watch for watch in self._watches if watch._collection == reference._collection]
+        if watches:
+            snapshot = self._snapshot(reference)
+            for watch in watches:
+                watch._push(DocumentChange(change_type, snapshot, -1, -1))
+
+    def _check_option(self, doc, option):
+        exists = getattr(option, "_exists", None)
+        if exists is True and doc is None:
+            raise NotFound("Document does not exist")
+        if exists is False and doc is not None:
+            raise FailedPrecondition("Document already exists")
+        last_update_time = getattr(option, "_last_update_time", None)
+        if last_update_time is not None:
+            if doc is None or doc["update_time"] != last_update_time:
+                raise FailedPrecondition("Document was modified")
+
+    # Public client API
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.split("/", 1)
+        return FakeDocumentReference(self, collection, doc_id)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        self._rpc("get_all")
+        for reference in references:
+            snapshot = self._snapshot(reference)
+            if transaction is not None:
+                transaction._record_read(snapshot)
+            yield snapshot
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return FakeTransaction(self, max_attempts=max_attempts)
+
+    def reset_counters(self):
+        with self._lock:
+            self.rpcs.clear()
+
+    def seed(self, drivers=100, teams=10, seed=0):
+        """Fill the drivers and teams collections with deterministic sample data"""
+        rng = random.Random(seed)
+        now = _now()
+        with self._lock:
+            team_docs = self._collections.setdefault("teams", {})
+            team_ids = []
+            for i in range(teams):
+                team_id = f"team{i:04d}"
+                team_ids.append(team_id)
+                team_docs[team_id] = {"data": {
+                    "name": TEAM_NAMES[i % len(TEAM_NAMES)] + (f" {i // len(TEAM_NAMES)}" if i >= len(TEAM_NAMES) else ""),
+                    "year_founded": rng.randint(1950, 2020),
+                    "race_wins": rng.randint(0, 250),
+                    "pole_positions": rng.randint(0, 250),
+                    "constructor_titles": rng.randint(0, 16),
+                    "finishing_position": i + 1,
+                    "created_by": "seed",
+                }, "create_time": now, "update_time": now}
+
+            driver_docs = self._collections.setdefault("drivers", {})
+            for i in range(drivers):
+                team_index = rng.randrange(teams) if teams else None
+                driver_docs[f"driver{i:06d}"] = {"data": {
+                    "name": f"Driver {i:06d}",
+                    "age": rng.randint(18, 45),
+                    "team": team_docs[team_ids[team_index]]["data"]["name"] if teams else "",
+                    "team_id": team_ids[team_index] if teams else "",
+                    "nationality": rng.choice(NATIONALITIES),
+                    "race_wins": rng.randint(0, 100),
+                    "pole_positions": rng.randint(0, 100),
+                    "fastest_laps": rng.randint(0, 80),
+                    "world_titles": rng.randint(0, 7),
+                    "active": rng.random() < 0.5,
+                    "created_by": "seed",
+                    "created_at": now,
+                    "updated_at": now,
+                }, "create_time": now, "update_time": now}
+
+
+def install(client):
+    """
+    Make firebase_admin hand out `client` instead of a real Firestore client
+
+    Must run before importing firebase_init, main or the app package, which
+    create their clients at import time. Registering a placeholder default
+    app stops them from loading a service-account file.
+    """
+    import firebase_admin
+    from firebase_admin import firestore
+
+    firebase_admin._apps.setdefault(firebase_admin._DEFAULT_APP_NAME, object())
+    firestore.client = lambda app=None, database_id=None: client
+    return client
@@ -0,0 +1,215 @@
+"""
+Load-test the Flask routes against the in-memory Firestore stand-in
+
+Seeds the stand-in with N drivers and T teams, then drives each scenario
+through Flask test clients from a pool of worker threads and reports
+throughput, p50/p95/p99 latency and Firestore RPCs per request. Results can
+be written as JSON and compared with an earlier run.
+
+    python benchmarks/load_test.py --drivers 2000 --concurrency 8 --requests 400
+    python benchmarks/load_test.py --scenarios page_drivers api_stats --output after.json --compare before.json
+    python benchmarks/load_test.py --cold   # clear in-process caches before every request
+    python benchmarks/load_test.py --replica feed   # serve driver lists from the in-process replica
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_firestore import FakeFirestore, install  # noqa: E402
+
+db = install(FakeFirestore())
+
+import main  # noqa: E402
+from app import create_app  # noqa: E402
+from app.analytics import driver_analytics  # noqa: E402
+from app.compare import comparison_cache  # noqa: E402
+from app.replica import driver_replica  # noqa: E402
+from app.search import driver_index  # noqa: E402
+from app.teams import team_resolver  # noqa: E402
+
+USER = {"uid": "load-test", "email": "load-test@example.com"}
+
+
+def _driver_ids(count):
+    return sorted(db._collections.get("drivers", {}))[:count]
+
+
+def _driver_form(i):
+    return {
+        "name": f"Load Driver {i}", "age": 25, "team_id": "team0000",
+        "race_wins": i % 50, "pole_positions": 0, "fastest_laps": 0, "world_titles": 0,
+    }
+
+
+# name -> (app, method, path or path(i), form data or data(i))
+SCENARIOS = {
+    "all_drivers": ("main", "GET", "/get_drivers?format=json", None),
+    "page_drivers": ("main", "GET", "/get_drivers?format=json&limit=10", None),
+    "teams": ("main", "GET", "/get_teams", None),
+    "search_text": ("main", "GET", lambda i: f"/search_drivers?q=driver {i % 100:02d}", None),
+    "search_numeric": ("main", "GET", lambda i: f"/search_drivers?field=age&value={18 + i % 28}", None),
+    "compare_grid": ("main", "GET", lambda i: "/compare_drivers?format=json&ids=" + ",".join(_driver_ids(20)), None),
+    "add_driver": ("main", "POST", "/add_driver", _driver_form),
+    "api_drivers": ("api", "GET", "/api/drivers?limit=20", None),
+    "api_driver": ("api", "GET", lambda i: f"/api/drivers/driver{i % 100:06d}", None),
+    "api_stats": ("api", "GET", "/api/stats", None),
+    "api_search": ("api", "GET", lambda i: f"/api/drivers/search?q=driver {i % 100:02d}", None),
+    "analytics": ("main", "GET", lambda i: ("/api/analytics/summary", "/api/analytics/teams",
+                                            "/api/analytics/leaderboard?stat=race_wins&limit=20")[i % 3], None),
+}
+
+
+def clear_caches():
+    main.cache.clear()
+    comparison_cache.clear()
+    driver_index.invalidate()
+    team_resolver.forget()
+    driver_replica.invalidate()
+    driver_analytics.invalidate()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(name, apps, requests, concurrency, warmup, cold):
+    app_name, method, path, data = SCENARIOS[name]
+    app = apps[app_name]
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+            with local.client.session_transaction() as session:
+                session["user"] = dict(USER)
+        return local.client
+
+    def one(i):
+        url = path(i) if callable(path) else path
+        form = data(i) if callable(data) else data
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        response = client().open(url, method=method, data=form)
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code
+
+    for i in range(warmup):
+        one(i)
+
+    db.reset_counters()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(warmup, warmup + requests)))
+    wall = time.perf_counter() - start
+    rpcs = sum(db.rpcs.values())
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+    errors = sum(1 for _, status in samples if status >= 400)
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1], 2),
+        "rpcs": rpcs,
+        "rpcs_per_request": round(rpcs / requests, 3),
+        "rpcs_by_type": dict(db.rpcs),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    previous = {row["scenario"]: row for row in (baseline or {}).get("results", [])}
+    header = f"{'scenario':<16}{'rps':>9}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}{'rpcs/req':>10}{'errors':>8}"
+    if previous:
+        header += f"{'rps vs base':>13}{'p95 vs base':>13}"
+    print(header)
+    for row in results:
+        line = (f"{row['scenario']:<16}{row['throughput_rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                f"{row['p99_ms']:>9}{row['rpcs_per_request']:>10}{row['errors']:>8}")
+        base = previous.get(row["scenario"])
+        if base:
+            line += f"{(row['throughput_rps'] / base['throughput_rps'] - 1) * 100:>+12.1f}%"
+            line += f"{(row['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%" if base["p95_ms"] else f"{'':>13}"
+        print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--teams", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.002, help="Simulated seconds per Firestore RPC")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--cold", action="store_true", help="Clear in-process caches before every request")
+    parser.add_argument("--replica", choices=["off", "versions", "feed"], default=driver_replica.mode,
+                        help="Drivers replica mode (default: DRIVER_REPLICA)")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    db.seed(drivers=args.drivers, teams=args.teams)
+    db.latency = args.latency
+    driver_replica.mode = args.replica
+
+    # Rate limits would turn a load test into a test of the limiter
+    main.limiter.enabled = False
+    main.app.config["TESTING"] = True
+    apps = {"main": main.app, "api": create_app()}
+    for limiter in apps["api"].extensions.get("limiter", ()):
+        limiter.enabled = False
+
+    results = []
+    for name in args.scenarios:
+        clear_caches()
+        results.append(run_scenario(name, apps, args.requests, args.concurrency, args.warmup, args.cold))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "run": {
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "commit": _git_commit(),
+                    "python": platform.python_version(),
+                    **{key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+                },
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -5,7 +5,7 @@ import secrets
 from datetime import timedelta
 from functools import wraps
 
-from flask import Flask, render_template, request, redirect, jsonify, session, url_for
+from flask import Flask, Response, render_template, request, redirect, jsonify, session, url_for, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
@@ -23,54 +23,29 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True  # Prevent JavaScript access to coo
 app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'  # Require HTTPS in production
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Prevent CSRF attacks while allowing links
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)  # Auto logout after 2 hours
-app.config['SESSION_TYPE'] = 'filesystem'  # Store sessions on server filesystem
 
-# Setup Simple Caching instead of Redis
-class SimpleCache:
-    def __init__(self):
-        self.cache = {}
-        self.timeouts = {}
-    
-    def get(self, key):
-        # Check if key exists and hasn't expired
-        if key in self.cache and (key not in self.timeouts or self.timeouts[key] > time.time()):
-            return self.cache[key]
-        return None
-    
-    def set(self, key, value, timeout=300):
-        self.cache[key] = value
-        if timeout:
-            self.timeouts[key] = time.time() + timeout
-    
-    def delete(self, key):
-        if key in self.cache:
-            del self.cache[key]
-        if key in self.timeouts:
-            del self.timeouts[key]
-    
-    def cached(self, timeout=300, key_prefix=''):
-        def decorator(f):
-            @wraps(f)
-            def decorated_function(*args, **kwargs):
-                cache_key = key_prefix
-                result = self.get(cache_key)
-                if result is None:
-                    result = f(*args, **kwargs)
-                    self.set(cache_key, result, timeout)
-                return result
-            return decorated_function
-        return decorator
-
-# Initialize the simple cache
-cache = SimpleCache()
-
-# Setup Rate Limiting without Redis
+# Setup bounded in-process caching instead of Redis
+from app.cache import LRUCache
+from app.singleflight import coalesce, single_flight
+from app.limiter_storage import LIMITER_STORAGE_URI, LIMITER_STRATEGY
+
+cache = LRUCache(
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 1024)),
+    max_bytes=int(os.environ.get('CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    default_timeout=int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
+)
+
+# Rate limits are counted in shared storage (RATELIMIT_STORAGE_URI: Redis
+# across instances, or a SQLite file across this instance's workers) so they
+# aren't multiplied by the number of processes; memory is the fallback if the
+# storage is unreachable
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://",  # Use in-memory storage instead of Redis
-    strategy="fixed-window"
+    storage_uri=LIMITER_STORAGE_URI,
+    strategy=LIMITER_STRATEGY,
+    in_memory_fallback_enabled=True
 )
 
 # Initialize Firebase Admin if not already initialized
@@ -83,49 +58,30 @@ auth = firebase_auth  # Alias firebase_auth as auth for consistent usage
 
 # Import the auth blueprint
 from app.auth import auth_bp
+from app import database
+from app.stats import apply_stats_delta
+from app.search import driver_index, SEARCH_FIELDS
+from app.validation import validate_driver, validate_team
+from app.token_cache import VerifiedTokenCache
+from app.http_client import identity_toolkit
+from app.teams import team_resolver
+from app.compare import compare_drivers as build_comparison, MAX_COMPARE_DRIVERS, comparison_cache
+from app.profiler import profiler, query_shape
+from app.metrics import init_metrics, metrics
+from app.versions import bump_version, collection_versions
+from app.http_cache import conditional, init_compression
+from app.json_provider import init_json, stream_json_array, JSON_STREAM_THRESHOLD
+from app.change_feed import change_feed
+from app.replica import driver_replica, HASH_INDEXED
+from app.analytics import analytics_bp, driver_analytics
+from app.sessions import init_sessions, regenerate_session, end_session
 
 # Register the blueprint
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
+app.register_blueprint(analytics_bp, url_prefix="/api/analytics")
 
-# 🔹 Additional security for login route
-@app.before_request
-def make_session_permanent():
-    global time  # Add this line to ensure we're using the global module
-    # Always make sessions permanent with the configured lifetime
-    session.permanent = True
-    
-    # Initialize last_activity if it doesn't exist
-    if 'last_activity' not in session:
-        session['last_activity'] = time.time()
-        return
-    
-    # Check for session expiration only if user is logged in
-    if 'user' in session:
-        try:
-            last_active = float(session['last_activity'])
-            current_time = time.time()
-            
-            # If last activity was more than 2 hours ago, clear session
-            if current_time - last_active > 7200:  # 2 hours in seconds
-                session.clear()
-                if request.path not in ['/auth', '/login', '/register', '/google-login']:
-                    return redirect('/auth')
-        except (ValueError, TypeError):
-            # Reset if invalid timestamp stored
-            session['last_activity'] = time.time()
-    
-    # Update last activity timestamp
-    session['last_activity'] = time.time()
-
-@app.before_request
-def make_session_permanent():
-    try:
-        session['last_activity'] = time.time()
-    except Exception as e:
-        app.logger.error(f"Error updating session: {e}")
-        # Provide a fallback
-        import time as time_module
-        session['last_activity'] = time_module.time()
+# 🔹 Server-side sessions; signed-in sessions idle for 2 hours are cleared
+init_sessions(app)
 
 # 🔹 Check if user is logged in
 def is_logged_in():
@@ -141,6 +97,45 @@ def login_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# Verified ID tokens, so repeat API calls skip JWT parsing and RSA verification
+token_cache = VerifiedTokenCache(max_entries=int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 4096)))
+
+# Prometheus metrics at /metrics, served only with METRICS_TOKEN set (and
+# METRICS_DIR when running several gunicorn workers)
+init_metrics(app, limiter=limiter)
+metrics.add_cache('drivers', cache)
+metrics.add_cache('tokens', token_cache)
+metrics.add_cache('comparisons', comparison_cache)
+
+# msgspec-backed jsonify(); gzip/brotli for JSON responses; ETags come from
+# the collection versions
+init_json(app)
+init_compression(app)
+
+@collection_versions.add_listener
+def drop_stale_caches(changed):
+    # Another worker (or tool) wrote to these collections since we last looked.
+    # Our own writes already evicted what they touched and aren't reported here
+    tags = []
+    if 'drivers' in changed:
+        tags.append('drivers:*')
+    if 'teams' in changed:
+        tags.append('teams:*')
+        team_resolver.forget()
+    if tags:
+        cache.invalidate_tags(*tags)
+        # The index only patches itself for this process's writes; team
+        # renames change the team_name it indexed
+        driver_index.invalidate()
+
+@change_feed.add_listener
+def reread_versions(changed):
+    # The live listener saw a write (possibly from another worker); re-read the
+    # counters on next use instead of waiting out their ttl. Only a re-read:
+    # writes of our own show up here too, and the refresh leaves those out of
+    # what drop_stale_caches evicts
+    collection_versions.invalidate()
+
 # 🔹 Firebase token verification decorator for API requests
 def verify_firebase_token(f):
     @wraps(f)
@@ -156,8 +151,8 @@ def verify_firebase_token(f):
         id_token = auth_header.split("Bearer ")[1]
         
         try:
-            # Verify the token with Firebase
-            decoded_token = auth.verify_id_token(id_token)
+            # Verify the token with Firebase (cached until the token's own expiry)
+            decoded_token = token_cache.verify(id_token)
             
             # Attach user info to request object for use in the route
             request.user = decoded_token
@@ -177,6 +172,7 @@ def verify_firebase_token(f):
 # Example API route using the verify_firebase_token decorator
 @app.route('/api/drivers', methods=['GET'])
 @verify_firebase_token
+@conditional('drivers', vary_user=True)
 def api_get_drivers():
     try:
         # Get user ID from the verified token
@@ -184,13 +180,15 @@ def api_get_drivers():
         
         # Fetch drivers with limit
         limit = int(request.args.get('limit', 10))
-        drivers = db.collection('drivers').limit(limit).stream()
-        
-        drivers_list = []
-        for doc in drivers:
-            driver_data = doc.to_dict()
-            driver_data['id'] = doc.id
-            drivers_list.append(driver_data)
+        with profiler.operation('main.api_get_drivers', shape=query_shape('drivers', limit=limit)):
+            drivers = db.collection('drivers').limit(limit).stream()
+            
+            drivers_list = []
+            for doc in drivers:
+                driver_data = doc.to_dict()
+                driver_data['id'] = doc.id
+                drivers_list.append(driver_data)
+            profiler.annotate(reads=len(drivers_list))
             
         return jsonify({
             "drivers": drivers_list,
@@ -234,6 +232,7 @@ def login():
         session["created_at"] = time.time()
         session["user_agent"] = request.headers.get("User-Agent")
         session["ip_address"] = request.remote_addr
+        regenerate_session()
         
         # Log successful login
         app.logger.info(f"Successful login: {email} from {request.remote_addr}")
@@ -281,6 +280,7 @@ def google_login():
                 "uid": uid,
                 "display_name": user_name
             }
+            regenerate_session()
             
             # Log successful Google login
             app.logger.info(f"Google login: {user_email} ({uid}) from {request.remote_addr}")
@@ -437,8 +437,8 @@ def logout():
     # For Firebase tokens, you might want to add token revocation
     # with firebase_admin.auth.revoke_refresh_tokens(session["user"]["uid"])
     
-    # Clear the session
-    session.clear()
+    # Delete the stored session, not just its contents
+    end_session()
     return redirect("/auth")
 
 # Add a route to verify session is still valid
@@ -465,50 +465,35 @@ def index():
 @login_required
 def add_driver():
     try:
-        name = request.form['name']
-        age = int(request.form['age'])
-        team = request.form['team']  # Keep this as team for backward compatibility
-        team_id = request.form.get('team_id', '')  # Get team_id if provided
-        race_wins = int(request.form['race_wins'])
-        pole_positions = int(request.form['pole_positions'])
-        fastest_laps = int(request.form['fastest_laps'])
-        world_titles = int(request.form['world_titles'])
-
-        # Validate input
-        if not name:
-            return jsonify({"error": "Driver name is required", "status": "error"}), 400
-        if not team and not team_id:
-            return jsonify({"error": "Team information is required", "status": "error"}), 400
-        if age < 18 or age > 50:
-            return jsonify({"error": "Age must be between 18 and 50", "status": "error"}), 400
-        if race_wins < 0 or pole_positions < 0 or fastest_laps < 0 or world_titles < 0:
-            return jsonify({"error": "Values cannot be negative", "status": "error"}), 400
-
-        # If team_id is provided, verify that the team exists
+        # Validate input (shared with the bulk import tool)
+        try:
+            driver_data = validate_driver(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e), "status": "error"}), 400
+        team_id = driver_data.get('team_id')
+
+        # If team_id is provided, verify that the team exists (usually served
+        # from the warm team-name map without a read)
         if team_id:
-            team_doc = db.collection('teams').document(team_id).get()
-            if not team_doc.exists:
+            team_name = team_resolver.resolve([team_id]).get(team_id)
+            if team_name is None:
                 return jsonify({"error": f"Team with ID {team_id} not found", "status": "error"}), 400
             # Store the team name for backward compatibility
-            team = team_doc.to_dict().get('name', '')
-
-        driver_data = {
-            "name": name,
-            "age": age,
-            "team": team,  # Keep storing team name for backward compatibility
-            "race_wins": race_wins,
-            "pole_positions": pole_positions,
-            "fastest_laps": fastest_laps,
-            "world_titles": world_titles,
-            "created_by": session["user"]["uid"],  # Track who created this driver
-            "created_at": firestore.SERVER_TIMESTAMP  # Add timestamp
-        }
-        
-        # If we have a team_id, store it as well
-        if team_id:
-            driver_data["team_id"] = team_id
-
-        db.collection('drivers').add(driver_data)
+            driver_data['team'] = team_name
+
+        driver_data["created_by"] = session["user"]["uid"]  # Track who created this driver
+        driver_data["created_at"] = firestore.SERVER_TIMESTAMP  # Add timestamp
+
+        # Write the driver and its stats increments in one batch
+        driver_ref = db.collection('drivers').document()
+        batch = db.batch()
+        batch.set(driver_ref, driver_data)
+        apply_stats_delta(batch, None, driver_data)
+        bump_version(batch, 'drivers')
+        with profiler.operation('main.add_driver'), collection_versions.local_write('drivers'):
+            batch.commit()
+            profiler.annotate(writes=3)
+        driver_index.upsert(driver_ref.id, driver_data)
         
         # Invalidate cache after adding
         invalidate_driver_caches()
@@ -524,37 +509,101 @@ def add_driver():
 # ✅ Optimized and cached route to get drivers
 @app.route('/get_drivers', methods=['GET'])
 @login_required
+@conditional('drivers', 'teams')
 def get_drivers():
     try:
-        drivers = db.collection('drivers').stream()
-        drivers_list = [{"id": doc.id, **doc.to_dict()} for doc in drivers]
-        return jsonify(drivers_list), 200
+        fields = parse_fields(request.args.get('fields'))
+        if fields is False:
+            return jsonify({"error": "fields must be a comma-separated list of field names"}), 400
+
+        # Without paging parameters keep returning the full list (used by index.html)
+        if 'limit' not in request.args and 'start_after' not in request.args:
+            drivers = fetch_all_drivers(fields)
+            # Very large lists go out in chunks rather than as one encoded body
+            if len(drivers) >= JSON_STREAM_THRESHOLD:
+                return stream_json_array(drivers)
+            return jsonify(drivers), 200
+
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        start_after = request.args.get('start_after') or None
+
+        try:
+            drivers, next_cursor = fetch_drivers_page(limit, start_after, fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        has_more = len(drivers) == limit
+
+        return jsonify({
+            "drivers": drivers,
+            "pagination": {
+                "count": len(drivers),
+                "limit": limit,
+                "has_more": has_more,
+                "next_page": next_cursor if has_more else None
+            }
+        }), 200
     except Exception as e:
         app.logger.error(f"Error in get_drivers: {str(e)}")
         return jsonify({"error": str(e)}), 400  # ✅ Always return JSON
 
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def parse_fields(value):
+    """Parse a ?fields=a,b,c projection, returning None if absent or False if invalid"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if not fields or not all(FIELD_NAME_PATTERN.match(field) for field in fields):
+        return False
+    return tuple(sorted(set(fields)))
+
+# Cache tags: "drivers:*" for driver lists and "teams:*" for team lists and
+# anything embedding team names. Team-filtered lists aren't cached here, so a
+# driver write drops every driver list. Single drivers aren't cached either:
+# the edit form needs the current update_time, or every save would conflict
+@cache.cached(timeout=60, key_prefix='drivers', tags=['drivers:*', 'teams:*'])
+@coalesce('drivers')
+@profiler.profile('main.fetch_all_drivers')
+def fetch_all_drivers(fields=None):
+    if driver_replica.available():
+        profiler.annotate(shape='replica/drivers', reads=0)
+        return team_resolver.attach(driver_replica.all(fields))
+    query = db.collection('drivers')
+    if fields:
+        query = query.select(list(fields))
+    profiler.annotate(shape=query_shape('drivers', fields=fields))
+    return team_resolver.attach([{"id": doc.id, **doc.to_dict()} for doc in query.stream()])
+
+@cache.cached(timeout=60, key_prefix='drivers:page', tags=['drivers:*', 'teams:*'])
+def fetch_drivers_page(limit, start_after=None, fields=None):
+    drivers, next_cursor = database.get_drivers(limit, start_after, fields=fields)
+    return team_resolver.attach(drivers), next_cursor
+
 # Cache invalidation function - call this when data changes
 def invalidate_driver_caches():
-    # Simplified version that clears all cache 
-    # In a real app, you would want more granular cache invalidation
-    cache.cache = {}
-    cache.timeouts = {}
+    # Only evict the entries a driver write can affect; team lists stay cached
+    cache.invalidate_tags('drivers:*')
 
 # Apply @login_required to other routes that need authentication
 @app.route('/add_team', methods=['POST'])
 @login_required
 def add_team():
     try:
-        team_data = {
-            "name": request.form['name'],
-            "year_founded": int(request.form['year_founded']),
-            "race_wins": int(request.form['race_wins']),
-            "pole_positions": int(request.form['pole_positions']),
-            "constructor_titles": int(request.form['constructor_titles']),
-            "finishing_position": int(request.form['finishing_position']),
-            "created_by": session["user"]["uid"]  # Track who created this team
-        }
-        db.collection('teams').add(team_data)
+        team_data = validate_team(request.form)
+        team_data["created_by"] = session["user"]["uid"]  # Track who created this team
+        # Write the team and bump the teams version together
+        team_ref = db.collection('teams').document()
+        batch = db.batch()
+        batch.set(team_ref, team_data)
+        bump_version(batch, 'teams')
+        with profiler.operation('main.add_team'), collection_versions.local_write('teams'):
+            batch.commit()
+            profiler.annotate(writes=2)
+        team_resolver.remember(team_ref.id, team_data['name'])
+        cache.invalidate_tags('teams:*')
         return jsonify({"message": "Team added successfully!"}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -562,29 +611,54 @@ def add_team():
 # Cached teams endpoint
 @app.route('/get_teams', methods=['GET'])
 @login_required
+@conditional('teams')
 def get_teams():
     try:
-        teams = db.collection('teams').stream()
-        teams_list = [{"id": doc.id, **doc.to_dict()} for doc in teams]
-        return jsonify(teams_list), 200
+        return jsonify(fetch_all_teams()), 200
     except Exception as e:
         app.logger.error(f"Error in get_teams: {str(e)}")
         return jsonify({"error": str(e)}), 400  # ✅ Always return JSON
 
+# Live driver/team changes as Server-Sent Events. ?snapshot=1 starts the
+# stream with the full lists, so a page needs no /get_drivers or /get_teams
+@app.route('/changes', methods=['GET'])
+@login_required
+@limiter.exempt
+def changes():
+    try:
+        stream = change_feed.subscribe(
+            last_event_id=request.headers.get('Last-Event-ID'),
+            snapshot=request.args.get('snapshot') == '1'
+        )
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        app.logger.error(f"Error starting change feed: {str(e)}")
+        return jsonify({"error": "Change feed is unavailable"}), 503
+    if stream is None:
+        # EventSource gives up on a non-stream response; pages fall back to fetching
+        return jsonify({"error": "Too many live connections"}), 503, {'Retry-After': '30'}
+
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@cache.cached(timeout=300, key_prefix='teams', tags=['teams:*'])
+@coalesce('teams')
+@profiler.profile('main.fetch_all_teams', shape='teams')
+def fetch_all_teams():
+    teams = db.collection('teams').stream()
+    return [{"id": doc.id, **doc.to_dict()} for doc in teams]
+
 @app.route('/delete_driver/<driver_id>', methods=['POST'])
 @login_required
 @limiter.limit("10 per minute")
 def delete_driver(driver_id):
     try:
-        # Optional: Check if user is allowed to delete this driver
-        driver = db.collection('drivers').document(driver_id).get()
-        if driver.exists:
-            driver_data = driver.to_dict()
-            if 'created_by' in driver_data and driver_data['created_by'] != session["user"]["uid"]:
-                app.logger.warning(f"Unauthorized delete attempt: User {session['user']['uid']} tried to delete driver {driver_id}")
-                return jsonify({"error": "You don't have permission to delete this driver"}), 403
-                
-        db.collection('drivers').document(driver_id).delete()
+        # Ownership is checked and the driver deleted (with its stats decrements)
+        # in one transaction, so there is no separate read to race with
+        database.delete_driver(driver_id, owner_id=session["user"]["uid"])
         
         # Invalidate cache after deletion
         invalidate_driver_caches()
@@ -593,6 +667,13 @@ def delete_driver(driver_id):
         app.logger.info(f"Driver {driver_id} deleted by user {session['user']['uid']}")
         
         return jsonify({"message": "Driver deleted successfully!"}), 200
+    except database.DriverNotFound:
+        return jsonify({"error": "Driver not found"}), 404
+    except database.NotDriverOwner:
+        app.logger.warning(f"Unauthorized delete attempt: User {session['user']['uid']} tried to delete driver {driver_id}")
+        return jsonify({"error": "You don't have permission to delete this driver"}), 403
+    except database.DriverWriteConflict as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         app.logger.error(f"Driver deletion error: {str(e)}")
         return jsonify({"error": str(e)}), 400
@@ -602,12 +683,10 @@ def delete_driver(driver_id):
 def edit_driver(driver_id):
     if request.method == 'GET':
         try:
-            # Get the driver data to populate the edit form
-            driver_ref = db.collection('drivers').document(driver_id)
-            driver = driver_ref.get()
-            if (driver.exists):
-                driver_data = driver.to_dict()
-                driver_data['id'] = driver_id
+            # Read the driver uncached: its update_time is the form's conflict
+            # token, and a stale one would make every save fail with 409
+            driver_data = database.get_driver(driver_id)
+            if driver_data:
                 return render_template('edit_driver.html', driver=driver_data, user=session.get("user"))
             else:
                 return jsonify({"error": "Driver not found"}), 404
@@ -615,15 +694,6 @@ def edit_driver(driver_id):
             return jsonify({"error": str(e)}), 400
     else:  # POST
         try:
-            driver_ref = db.collection('drivers').document(driver_id)
-            
-            # Optional: Check if user is allowed to edit this driver
-            driver = driver_ref.get()
-            if driver.exists:
-                driver_data = driver.to_dict()
-                if 'created_by' in driver_data and driver_data['created_by'] != session["user"]["uid"]:
-                    return jsonify({"error": "You don't have permission to edit this driver"}), 403
-
             # Validate input
             name = request.form['name']
             age = int(request.form['age'])
@@ -651,9 +721,22 @@ def edit_driver(driver_id):
                 "last_edited_by": session["user"]["uid"]  # Track who last edited this driver
             }
 
-            driver_ref.update(updated_data)
+            # Ownership, the form's update_time and the write (with its stats
+            # adjustments) are all handled in one transaction
+            database.update_driver(
+                driver_id, updated_data, session["user"]["uid"],
+                owner_id=session["user"]["uid"],
+                expected_update_time=request.form.get('update_time')
+            )
+            invalidate_driver_caches()
             return redirect('/get_drivers')
 
+        except database.DriverNotFound:
+            return jsonify({"error": "Driver not found"}), 404
+        except database.NotDriverOwner:
+            return jsonify({"error": "You don't have permission to edit this driver"}), 403
+        except database.DriverWriteConflict:
+            return jsonify({"error": "This driver was changed by someone else. Reload the page and try again."}), 409
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
@@ -662,10 +745,19 @@ def edit_driver(driver_id):
 def search_drivers():
     field = request.args.get('field')
     value = request.args.get('value')
+    query = request.args.get('q')
 
     try:
+        # Free-text search across all indexed fields
+        if query:
+            return jsonify(driver_index.search(query, limit=50)), 200
+
         if not field or not value:
             return jsonify({"error": "Invalid search query"}), 400
+
+        # Text fields are answered from the in-memory index
+        if field in SEARCH_FIELDS:
+            return jsonify(driver_index.search(value, limit=50, fields=[field])), 200
         
         # Handle numeric fields
         numeric_fields = ['age', 'race_wins', 'pole_positions', 'fastest_laps', 'world_titles']
@@ -674,13 +766,21 @@ def search_drivers():
                 value = int(value)
             except ValueError:
                 return jsonify({"error": f"Value for {field} must be a number"}), 400
+
+        # Indexed equality lookups are answered by the drivers replica when it's on
+        if field in HASH_INDEXED and driver_replica.available():
+            return jsonify(driver_replica.where(field, value)), 200
         
-        query = db.collection('drivers').where(field, "==", value).stream()
-        results = []
-        for doc in query:
-            driver_data = doc.to_dict()
-            driver_data['id'] = doc.id  # Include document ID
-            results.append(driver_data)
+        # Only known field names go into the logged query shape
+        shape = query_shape('drivers', [(field if field in numeric_fields else '?', '==')])
+        with profiler.operation('main.search_drivers', shape=shape):
+            query = db.collection('drivers').where(field, "==", value).stream()
+            results = []
+            for doc in query:
+                driver_data = doc.to_dict()
+                driver_data['id'] = doc.id  # Include document ID
+                results.append(driver_data)
+            profiler.annotate(reads=len(results))
             
         return jsonify(results), 200
 
@@ -691,47 +791,32 @@ def search_drivers():
 @login_required
 def compare_drivers():
     try:
-        driver1_id = request.args.get('driver1')
-        driver2_id = request.args.get('driver2')
-
-        if not driver1_id or not driver2_id:
-            return jsonify({"error": "Please provide two driver IDs"}), 400
-
-        # Get driver documents from Firestore
-        driver1_doc = db.collection('drivers').document(driver1_id).get()
-        driver2_doc = db.collection('drivers').document(driver2_id).get()
+        # Drivers come from ?ids=a,b,c, repeated ?driver=, or the original driver1/driver2
+        if request.args.get('ids'):
+            requested = request.args.get('ids').split(',')
+        elif request.args.getlist('driver'):
+            requested = request.args.getlist('driver')
+        else:
+            requested = [request.args.get('driver1'), request.args.get('driver2')]
+        driver_ids = list(dict.fromkeys(i.strip() for i in requested if i and i.strip()))
 
-        # Check if documents exist
-        if not driver1_doc.exists:
-            return jsonify({"error": f"Driver with ID {driver1_id} not found"}), 404
-        if not driver2_doc.exists:
-            return jsonify({"error": f"Driver with ID {driver2_id} not found"}), 404
+        if len(driver_ids) < 2:
+            return jsonify({"error": "Please provide at least two driver IDs"}), 400
+        if len(driver_ids) > MAX_COMPARE_DRIVERS:
+            return jsonify({"error": f"At most {MAX_COMPARE_DRIVERS} drivers can be compared at once"}), 400
 
-        # Convert to dictionaries and add IDs
-        driver1 = driver1_doc.to_dict()
-        driver1['id'] = driver1_id
-        
-        driver2 = driver2_doc.to_dict()
-        driver2['id'] = driver2_id
+        # One batched read for every driver; ranks and deltas are cached per stat values
+        try:
+            comparison = build_comparison(driver_ids)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
 
         # Check if format=json is requested
         if request.args.get('format') == 'json':
-            # Calculate stat differences for the comparison
-            comparison = {
-                "driver1": driver1,
-                "driver2": driver2,
-                "comparison": {
-                    "age_diff": abs(driver1['age'] - driver2['age']),
-                    "wins_diff": abs(driver1['race_wins'] - driver2['race_wins']),
-                    "poles_diff": abs(driver1['pole_positions'] - driver2['pole_positions']),
-                    "fastest_laps_diff": abs(driver1['fastest_laps'] - driver2['fastest_laps']),
-                    "titles_diff": abs(driver1['world_titles'] - driver2['world_titles'])
-                }
-            }
             return jsonify(comparison), 200
         else:
             # Render comparison template
-            return render_template("compare.html", driver1=driver1, driver2=driver2, user=session.get("user"))
+            return render_template("compare.html", user=session.get("user"), **comparison)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -765,6 +850,37 @@ def rate_limit_status():
         }
     })
 
+# Cache statistics endpoint for monitoring
+@app.route("/cache-status")
+@login_required
+def cache_status():
+    # Only allow admin users to access this endpoint
+    if session.get("user", {}).get("email") not in ["admin@example.com"]:  # Replace with your admin emails
+        return jsonify({"error": "Unauthorized"}), 403
+
+    return jsonify({
+        **cache.stats(),
+        "single_flight": single_flight.stats(),
+        "token_cache": token_cache.stats(),
+        "identity_toolkit": identity_toolkit.stats(),
+        "change_feed": change_feed.stats(),
+        "driver_replica": driver_replica.stats(),
+        "analytics": driver_analytics.stats()
+    })
+
+# Firestore profiling endpoint: latency histograms, reads/writes per operation and route
+@app.route("/profiler-status")
+@login_required
+def profiler_status():
+    # Only allow admin users to access this endpoint
+    if session.get("user", {}).get("email") not in ["admin@example.com"]:  # Replace with your admin emails
+        return jsonify({"error": "Unauthorized"}), 403
+
+    stats = profiler.stats()
+    if request.args.get('reset') == 'true':
+        profiler.reset()
+    return jsonify(stats)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0')
 
@@ -0,0 +1,71 @@
+"""
+Maintenance commands for the F1 database
+
+    python manage.py rebuild-stats
+    python manage.py import drivers drivers.ndjson [--workers 4] [--dry-run]
+    python manage.py export teams teams.csv
+"""
+import argparse
+import json
+import sys
+
+# Initializes the Firebase Admin SDK before any app module creates a client
+import firebase_init  # noqa: F401
+
+def rebuild_stats(args):
+    from app.stats import rebuild_stats
+
+    stats = rebuild_stats()
+    print(json.dumps(stats, indent=2, default=str))
+
+def import_data(args):
+    from app.bulk import import_collection
+
+    summary = import_collection(args.collection, args.path, fmt=args.format,
+                                max_workers=args.workers, dry_run=args.dry_run)
+    for error in summary.pop("errors"):
+        print(f"error: {error}", file=sys.stderr)
+    print(json.dumps(summary, indent=2))
+
+    # Bulk writes bypass the per-write stats increments
+    if args.collection == "drivers" and summary["written"]:
+        rebuild_stats(args)
+
+def export_data(args):
+    from app.bulk import export_collection
+
+    count = export_collection(args.collection, args.path, fmt=args.format)
+    print(f"Exported {count} {args.collection}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="F1 database maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-stats", help="Recompute the materialized driver stats document")
+    rebuild.set_defaults(func=rebuild_stats)
+
+    importer = subparsers.add_parser("import", help="Load drivers or teams from an NDJSON or CSV file")
+    importer.add_argument("collection", choices=["drivers", "teams"])
+    importer.add_argument("path", help="Input file, or - for stdin (requires --format)")
+    importer.add_argument("--format", choices=["ndjson", "csv"])
+    importer.add_argument("--workers", type=int, default=4, help="Batches committed in parallel")
+    importer.add_argument("--dry-run", action="store_true", help="Validate without writing")
+    importer.set_defaults(func=import_data)
+
+    exporter = subparsers.add_parser("export", help="Dump drivers or teams to an NDJSON or CSV file")
+    exporter.add_argument("collection", choices=["drivers", "teams"])
+    exporter.add_argument("path", help="Output file, or - for stdout (requires --format)")
+    exporter.add_argument("--format", choices=["ndjson", "csv"])
+    exporter.set_defaults(func=export_data)
+
+    args = parser.parse_args()
+    if args.command in ("import", "export"):
+        from app.bulk import detect_format
+        try:
+            detect_format(args.path, args.format)
+        except ValueError as e:
+            parser.error(str(e))
+    args.func(args)
+
+if __name__ == "__main__":
+    main()